@@ -83,7 +83,12 @@ def main():
 
     status.markdown("📦 **Loading delivery data & filter options...**")
     progress.progress(15, text="Loading data...")
-    filter_options = data_loader.get_filter_options()
+    try:
+        filter_options = data_loader.get_filter_options()
+    except Exception:
+        # Failures are not cached, so the next rerun retries
+        st.warning("⚠️ Filter options are unavailable right now — please refresh shortly")
+        filter_options = {}
 
     # Clear progress while user interacts with filters
     progress.empty()
@@ -118,9 +123,7 @@ def main():
 
     # Track selected PT codes for cross-page use
     if filters.get('products'):
-        st.session_state.selected_pt_codes = [
-            p.split(' - ')[0] for p in filters['products']
-        ]
+        st.session_state.selected_pt_codes = list(filters['products'])
     else:
         st.session_state.selected_pt_codes = None
 
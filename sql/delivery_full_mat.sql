@@ -0,0 +1,44 @@
+-- Materialized copy of delivery_full_view
+--
+-- The view re-runs all of its joins on every query. This table holds a
+-- snapshot refreshed every 5 minutes by the event below, so the dashboard
+-- loaders hit indexed rows instead.
+--
+-- Enable in the app with:  DELIVERY_SOURCE_TABLE=delivery_full_mat
+-- NOTE: rows can lag the base tables by up to one refresh interval
+--       (e.g. right after an ETD update).
+-- Requires: SET GLOBAL event_scheduler = ON;
+
+CREATE TABLE IF NOT EXISTS delivery_full_mat AS
+SELECT * FROM delivery_full_view;
+
+CREATE INDEX idx_dfm_etd ON delivery_full_mat (etd);
+CREATE INDEX idx_dfm_pt_code ON delivery_full_mat (pt_code);
+CREATE INDEX idx_dfm_created_by_name ON delivery_full_mat (created_by_name);
+CREATE INDEX idx_dfm_customer ON delivery_full_mat (customer);
+CREATE INDEX idx_dfm_timeline_status ON delivery_full_mat (delivery_timeline_status);
+CREATE INDEX idx_dfm_customs ON delivery_full_mat (is_epe_company, customer_country_code, legal_entity_country_code);
+
+-- Sales urgent list: seek on creator + timeline status, rest checked in the index
+CREATE INDEX idx_dfm_sales_urgent ON delivery_full_mat
+    (created_by_name, delivery_timeline_status, shipment_status, remaining_quantity_to_deliver);
+-- Overdue list: seek on timeline status, rows already in ORDER BY order
+CREATE INDEX idx_dfm_overdue ON delivery_full_mat
+    (delivery_timeline_status, days_overdue DESC, delivery_id DESC);
+
+-- Refresh: rebuild into a shadow table, then swap atomically
+DROP EVENT IF EXISTS refresh_delivery_full_mat;
+
+DELIMITER $$
+CREATE EVENT refresh_delivery_full_mat
+ON SCHEDULE EVERY 5 MINUTE
+DO
+BEGIN
+    DROP TABLE IF EXISTS delivery_full_mat_new;
+    CREATE TABLE delivery_full_mat_new LIKE delivery_full_mat;
+    INSERT INTO delivery_full_mat_new SELECT * FROM delivery_full_view;
+    RENAME TABLE delivery_full_mat TO delivery_full_mat_old,
+                 delivery_full_mat_new TO delivery_full_mat;
+    DROP TABLE delivery_full_mat_old;
+END$$
+DELIMITER ;
@@ -283,11 +283,15 @@ class Config:
             
             # Database pool
             "DB_POOL_SIZE": int(os.getenv("DB_POOL_SIZE", "5")),
-            "DB_POOL_RECYCLE": int(os.getenv("DB_POOL_RECYCLE", "3600")),
+            "DB_MAX_OVERFLOW": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+            "DB_POOL_RECYCLE": int(os.getenv("DB_POOL_RECYCLE", "1800")),
             
             # Cache
             "CACHE_TTL_SECONDS": int(os.getenv("CACHE_TTL_SECONDS", "300")),
             
+            # Delivery data source: delivery_full_view or delivery_full_mat
+            "DELIVERY_SOURCE_TABLE": os.getenv("DELIVERY_SOURCE_TABLE", "delivery_full_view"),
+            
             # Localization
             "TIMEZONE": os.getenv("TIMEZONE", "Asia/Ho_Chi_Minh"),
             
@@ -76,20 +76,26 @@ def _create_engine():
     
     # Pool settings
     pool_size = app_config.get("DB_POOL_SIZE", 5)
-    pool_recycle = app_config.get("DB_POOL_RECYCLE", 3600)
+    max_overflow = app_config.get("DB_MAX_OVERFLOW", 10)
+    pool_recycle = app_config.get("DB_POOL_RECYCLE", 1800)
     
+    # NOTE: PyMySQL does not implement protocol compression (compress=True
+    # raises NotImplementedError), so it is not passed via connect_args.
     engine = create_engine(
         url,
         poolclass=QueuePool,
         pool_size=pool_size,
-        max_overflow=10,
+        max_overflow=max_overflow,
         pool_timeout=30,
         pool_recycle=pool_recycle,
         pool_pre_ping=True,  # Auto-reconnect on stale connections
         echo=False
     )
     
-    logger.info(f"✅ Database engine created (pool_size={pool_size}, recycle={pool_recycle}s)")
+    logger.info(
+        f"✅ Database engine created (pool_size={pool_size}, "
+        f"max_overflow={max_overflow}, recycle={pool_recycle}s)"
+    )
     
     return engine
 
@@ -6,6 +6,13 @@ import pandas as pd
 import urllib.parse
 
 
+def _locations_by_date(delivery_df):
+    """Unique "province, country" strings per delivery date, from one pass over the frame"""
+    row_locations = (delivery_df['recipient_state_province'].astype(str) + ', '
+                     + delivery_df['recipient_country_name'].astype(str))
+    return row_locations.groupby(delivery_df['delivery_date'], sort=False).unique()
+
+
 class CalendarEventGenerator:
     """Generate iCalendar (.ics) files for delivery schedules with enhanced information"""
     
@@ -22,8 +29,10 @@ METHOD:REQUEST
 """
         
         # Group deliveries by date
-        delivery_df['delivery_date'] = pd.to_datetime(delivery_df['delivery_date'])
+        if not pd.api.types.is_datetime64_any_dtype(delivery_df['delivery_date']):
+            delivery_df['delivery_date'] = pd.to_datetime(delivery_df['delivery_date'])
         grouped = delivery_df.groupby('delivery_date')
+        locations_by_date = _locations_by_date(delivery_df)
         
         # Create an event for each delivery date
         for delivery_date, date_df in grouped:
@@ -133,7 +142,7 @@ METHOD:REQUEST
                         description += f"  Status: {status[0]}\\n"
             
             # Get locations for this date
-            locations = date_df.apply(lambda x: f"{x['recipient_state_province']}, {x['recipient_country_name']}", axis=1).unique()
+            locations = locations_by_date[delivery_date]
             location_str = "; ".join(locations[:3])  # Limit to first 3 locations
             if len(locations) > 3:
                 location_str += f" and {len(locations)-3} more"
@@ -173,8 +182,10 @@ END:VEVENT
         links = []
         
         # Group deliveries by date
-        delivery_df['delivery_date'] = pd.to_datetime(delivery_df['delivery_date'])
+        if not pd.api.types.is_datetime64_any_dtype(delivery_df['delivery_date']):
+            delivery_df['delivery_date'] = pd.to_datetime(delivery_df['delivery_date'])
         grouped = delivery_df.groupby('delivery_date')
+        locations_by_date = _locations_by_date(delivery_df)
         
         for delivery_date, date_df in grouped:
             # Format date and time for Google Calendar (Vietnam timezone)
@@ -262,7 +273,7 @@ END:VEVENT
                         details += f"  📦 {pt_code} {prod_pn}: {qty:,.0f} units\n"
             
             # Get locations
-            locations = date_df.apply(lambda x: f"{x['recipient_state_province']}, {x['recipient_country_name']}", axis=1).unique()
+            locations = locations_by_date[delivery_date]
             location_str = "; ".join(locations[:3])
             if len(locations) > 3:
                 location_str += f" +{len(locations)-3} more"
@@ -301,8 +312,10 @@ END:VEVENT
         links = []
         
         # Group deliveries by date
-        delivery_df['delivery_date'] = pd.to_datetime(delivery_df['delivery_date'])
+        if not pd.api.types.is_datetime64_any_dtype(delivery_df['delivery_date']):
+            delivery_df['delivery_date'] = pd.to_datetime(delivery_df['delivery_date'])
         grouped = delivery_df.groupby('delivery_date')
+        locations_by_date = _locations_by_date(delivery_df)
         
         for delivery_date, date_df in grouped:
             # Format date and time for Outlook
@@ -391,7 +404,7 @@ END:VEVENT
                         body += f"  📦 {pt_code} {prod_pn}: {qty:,.0f} units<br>"
             
             # Get locations
-            locations = date_df.apply(lambda x: f"{x['recipient_state_province']}, {x['recipient_country_name']}", axis=1).unique()
+            locations = locations_by_date[delivery_date]
             location_str = "; ".join(locations[:3])
             if len(locations) > 3:
                 location_str += f" +{len(locations)-3} more"
@@ -524,10 +537,11 @@ END:VEVENT
     """
         
         # Ensure delivery_date is datetime
-        delivery_df['delivery_date'] = pd.to_datetime(delivery_df['delivery_date'])
+        if not pd.api.types.is_datetime64_any_dtype(delivery_df['delivery_date']):
+            delivery_df['delivery_date'] = pd.to_datetime(delivery_df['delivery_date'])
         
         # Group deliveries by date and customs type
-        grouped = delivery_df.groupby(['delivery_date', 'customs_type'])
+        grouped = delivery_df.groupby(['delivery_date', 'customs_type'], observed=True)
         
         # Create events for each date and type combination
         for (delivery_date, customs_type), type_df in grouped:
@@ -82,14 +82,12 @@ def apply_client_filters(df: pd.DataFrame, filters: dict) -> pd.DataFrame:
         filters.get('exclude_timeline_status', False),
     )
 
-    # ── Products (need to extract pt_code from "PT001 - Name") ──
-    products = filters.get('products')
-    if products:
-        pt_codes = [p.split(' - ')[0] for p in products]
-        _apply_list_filter(
-            'pt_code', pt_codes,
-            filters.get('exclude_products', False),
-        )
+    # ── Products (widget values are raw pt_codes) ────────────────
+    _apply_list_filter(
+        'pt_code',
+        filters.get('products'),
+        filters.get('exclude_products', False),
+    )
 
     # ── Brands ───────────────────────────────────────────────────
     _apply_list_filter(
@@ -2,20 +2,630 @@
 
 import pandas as pd
 import streamlit as st
-from sqlalchemy import text
+from sqlalchemy import text, bindparam
+from sqlalchemy.exc import DBAPIError
 from ..db import get_db_engine
+from ..config import APP_CONFIG
 from .permissions import can_write_db
+import calendar
+import hashlib
+import importlib.util
+import json
 import logging
+import os
+import re
+import tempfile
+import threading
+import time
 from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
 
 
+def _delivery_source(name):
+    """Validated table/view name to read delivery rows from"""
+    if re.fullmatch(r'[A-Za-z_][A-Za-z0-9_]*', name or ''):
+        return name
+    logger.warning(f"Invalid DELIVERY_SOURCE_TABLE {name!r} — using delivery_full_view")
+    return 'delivery_full_view'
+
+
+# delivery_full_view, or its materialized copy (see sql/delivery_full_mat.sql)
+DELIVERY_SOURCE = _delivery_source(APP_CONFIG.get('DELIVERY_SOURCE_TABLE', 'delivery_full_view'))
+
+# Columns exposed by load_delivery_data(); also the whitelist for `columns=`
+ALL_COLUMNS = (
+    'delivery_id', 'dn_number', 'created_by_email', 'created_by_name',
+    'created_date', 'shipment_status', 'shipment_status_vn',
+    'dispatched_date', 'delivered_date', 'sto_delivery_status',
+    'sto_etd_date', 'is_delivered', 'delivery_confirmed',
+    'delivery_timeline_status', 'days_overdue', 'notify_email',
+    'reference_packing_list', 'shipping_cost', 'total_weight',
+    # Order info
+    'oc_id', 'oc_number', 'oc_date', 'oc_line_id', 'oc_product_pn',
+    'standard_quantity', 'selling_quantity', 'uom_conversion', 'etd',
+    # Product info
+    'product_id', 'product_pn', 'pt_code', 'package_size', 'brand',
+    # Stock info
+    'sto_dr_line_id', 'selling_stock_out_quantity',
+    'selling_stock_out_request_quantity', 'stock_out_quantity',
+    'stock_out_request_quantity', 'stockin_line_id', 'export_tax',
+    'remaining_quantity_to_deliver', 'total_instock_at_preferred_warehouse',
+    'total_instock_all_warehouses', 'gap_quantity', 'fulfill_rate_percent',
+    'fulfillment_status',
+    # Product-level gap analysis
+    'product_total_remaining_demand', 'product_active_delivery_count',
+    'product_gap_quantity', 'product_fulfill_rate_percent',
+    'delivery_demand_percentage', 'product_fulfillment_status',
+    # Customer info
+    'customer', 'customer_code', 'customer_street', 'customer_zip_code',
+    'customer_state_province', 'customer_country_code',
+    'customer_country_name', 'customer_contact',
+    'customer_contact_email', 'customer_contact_phone',
+    # Recipient info
+    'recipient_company', 'recipient_company_code', 'recipient_contact',
+    'recipient_contact_email', 'recipient_contact_phone',
+    'recipient_address', 'recipient_state_province',
+    'recipient_country_code', 'recipient_country_name',
+    # Other info
+    'is_epe_company', 'intl_charge', 'local_charge',
+    'legal_entity', 'legal_entity_code', 'legal_entity_state_province',
+    'legal_entity_country_code', 'legal_entity_country_name',
+    'preferred_warehouse',
+)
+ALLOWED_COLUMNS = frozenset(ALL_COLUMNS)
+
+# Narrow projection sufficient for pivot_delivery_data()
+PIVOT_COLUMNS = (
+    'delivery_id', 'etd', 'customer', 'recipient_company',
+    'standard_quantity', 'remaining_quantity_to_deliver', 'gap_quantity',
+    'product_gap_quantity', 'product_total_remaining_demand',
+)
+
+# DATE columns of the delivery source, typed at read time
+DATE_COLUMNS = (
+    'etd', 'oc_date', 'sto_etd_date', 'created_date',
+    'dispatched_date', 'delivered_date',
+)
+
+# Date columns of the schedule queries (DATE(etd) AS delivery_date would
+# otherwise come back as Arrow date/string values rather than datetime64)
+_SCHEDULE_DATE_COLUMNS = ['delivery_date', 'created_date']
+_CUSTOMS_DATE_COLUMNS = ['delivery_date', 'etd', 'created_date']
+
+# Low-cardinality status/code columns held as pandas categoricals
+CATEGORY_COLUMNS = (
+    'shipment_status', 'fulfillment_status', 'product_fulfillment_status',
+    'delivery_timeline_status', 'customer_country_code',
+    'legal_entity_country_code', 'is_epe_company', 'customs_type',
+)
+
+# Arrow-backed string/number columns need pandas >= 2.0 and pyarrow
+_ARROW_DTYPES = (
+    int(pd.__version__.split('.')[0]) >= 2
+    and importlib.util.find_spec('pyarrow') is not None
+)
+
+# Longer IN-list selections are bound as one JSON array via JSON_TABLE
+_JSON_TABLE_MIN_VALUES = 100
+
+# Server capabilities discovered at runtime
+_SQL_FEATURES = {'json_table': True}
+
+# Rows buffered per fetch when streaming the wide loaders (server-side cursor)
+_FETCH_SIZE = 10_000
+
+MONTH_NAMES = {month: calendar.month_name[month] for month in range(1, 13)}
+
+
+def _read_sql(sql, conn, params=None, chunksize=None, parse_dates=None):
+    """pd.read_sql with Arrow-backed columns where pandas supports it (>= 2.0)"""
+    if _ARROW_DTYPES:
+        return pd.read_sql(sql, conn, params=params, chunksize=chunksize,
+                           parse_dates=parse_dates, dtype_backend='pyarrow')
+    return pd.read_sql(sql, conn, params=params, chunksize=chunksize, parse_dates=parse_dates)
+
+def _optimize_dtypes(df):
+    """Convert CATEGORY_COLUMNS present in df to category (in place, returns df)
+
+    Group these columns with observed=True to avoid empty category groups.
+    """
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
+
+def _apply_in(query, params, expanding, column, key, values, exclude=False,
+              use_json_table=False):
+    """Append `AND column [NOT] IN :key` — no-op for an empty selection.
+
+    Values are de-duplicated and sorted so equal selections bind identically.
+    Selections longer than _JSON_TABLE_MIN_VALUES are sent as one JSON array
+    parameter unpacked by JSON_TABLE when use_json_table is set.
+    """
+    if not values:
+        return query
+    values = sorted(set(values))
+    operator = "NOT IN" if exclude else "IN"
+    
+    if use_json_table and len(values) > _JSON_TABLE_MIN_VALUES:
+        params[f'{key}_json'] = json.dumps(values, default=str)
+        return query + (
+            f" AND {column} {operator} (SELECT v FROM JSON_TABLE(:{key}_json, '$[*]'"
+            f" COLUMNS (v VARCHAR(255) PATH '$')) AS {key}_values)"
+        )
+    
+    params[key] = values
+    expanding.append(key)
+    return query + f" AND {column} {operator} :{key}"
+
+
+def _has_long_selection(filters):
+    """True if any list filter is long enough to use JSON_TABLE"""
+    return any(
+        isinstance(value, (list, tuple, set)) and len(set(value)) > _JSON_TABLE_MIN_VALUES
+        for value in (filters or {}).values()
+    )
+
+
+def _with_json_table_fallback(filters, run):
+    """Call run(use_json_table); fall back to plain IN-lists if the server rejects it.
+
+    JSON_TABLE needs MySQL 8.0 and a collation compatible with the filtered
+    columns — on failure it is disabled for the rest of the process.
+    """
+    if not (_SQL_FEATURES['json_table'] and _has_long_selection(filters)):
+        return run(False)
+    try:
+        return run(True)
+    except DBAPIError as e:
+        logger.warning(f"JSON_TABLE filter rejected, using IN-lists instead: {e}")
+        _SQL_FEATURES['json_table'] = False
+        return run(False)
+
+
+def _build_filter_sql(filters, use_json_table=False):
+    """Translate a filters dict into (AND-clauses, params, expanding param names)"""
+    query = ""
+    params = {}
+    expanding = []
+    if not filters:
+        return query, params, expanding
+    
+    # Products filter (raw pt_code values) with exclude option
+    query = _apply_in(query, params, expanding, 'pt_code', 'pt_codes', filters.get('products'),
+                      filters.get('exclude_products', False), use_json_table)
+    
+    # Brand filter with exclude option
+    query = _apply_in(query, params, expanding, 'brand', 'brands', filters.get('brands'),
+                      filters.get('exclude_brands', False), use_json_table)
+    
+    # Date range
+    if filters.get('date_from'):
+        query += " AND etd >= :date_from"
+        params['date_from'] = filters['date_from']
+    
+    if filters.get('date_to'):
+        query += " AND etd <= :date_to"
+        params['date_to'] = filters['date_to']
+    
+    # List filters with exclude option: (filter key, column)
+    for key, column in (
+        ('creators', 'created_by_name'),
+        ('customers', 'customer'),
+        ('ship_to_companies', 'recipient_company'),
+        ('states', 'recipient_state_province'),
+        ('countries', 'recipient_country_name'),
+        ('statuses', 'shipment_status'),
+        ('legal_entities', 'legal_entity'),
+        ('timeline_status', 'delivery_timeline_status'),
+    ):
+        query = _apply_in(query, params, expanding, column, key, filters.get(key),
+                          filters.get(f'exclude_{key}', False), use_json_table)
+    
+    # EPE Company filter (no exclude option needed as it's a radio button)
+    if filters.get('epe_filter'):
+        if filters['epe_filter'] == 'EPE Companies Only':
+            query += " AND is_epe_company = 'Yes'"
+        elif filters['epe_filter'] == 'Non-EPE Companies Only':
+            query += " AND is_epe_company = 'No'"
+    
+    # Foreign customer filter (no exclude option needed as it's a radio button)
+    if filters.get('foreign_filter'):
+        if filters['foreign_filter'] == 'Foreign Only':
+            query += " AND customer_country_code != legal_entity_country_code"
+        elif filters['foreign_filter'] == 'Domestic Only':
+            query += " AND customer_country_code = legal_entity_country_code"
+    
+    return query, params, expanding
+
+
+def _format_period_labels(periods, period):
+    """Format period-start timestamps as pivot labels"""
+    if period == 'daily':
+        return periods.dt.date.astype(str)
+    if period == 'weekly':
+        return 'Week of ' + periods.dt.strftime('%Y-%m-%d')
+    # monthly
+    return periods.dt.month.map(MONTH_NAMES) + ' ' + periods.dt.year.astype(str)
+
+
+# Period-start expressions for SQL-side pivots (weeks start on Monday)
+_PERIOD_SQL = {
+    'daily': "DATE(etd)",
+    'weekly': "DATE_SUB(DATE(etd), INTERVAL WEEKDAY(etd) DAY)",
+    'monthly': "DATE_SUB(DATE(etd), INTERVAL DAYOFMONTH(etd) - 1 DAY)",
+}
+
+_PIVOT_DISPLAY_NAMES = {
+    'period': 'Period',
+    'customer': 'Customer',
+    'recipient_company': 'Ship To',
+    'deliveries': 'Deliveries',
+    'total_quantity': 'Total Quantity',
+    'remaining': 'Remaining to Deliver',
+    'gap_legacy': 'Gap (Legacy)',
+    'product_gap': 'Product Gap',
+    'total_demand': 'Total Product Demand',
+}
+
+
+# ── Parquet disk cache (survives Streamlit restarts) ─────────────
+
+_DISK_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'delivery_cache')
+_DISK_CACHE_TTL = 300  # seconds — same as the in-memory cache
+
+
+def _filter_key(filters):
+    """Short content hash of a filters dict (order-independent)"""
+    payload = json.dumps(filters or {}, sort_keys=True, default=str)
+    return hashlib.md5(payload.encode('utf-8')).hexdigest()
+
+
+def _disk_cache_key(filter_key, columns):
+    """Stable short file name for a (filters, columns) combination"""
+    payload = f"{filter_key}|{','.join(columns or ())}"
+    return hashlib.md5(payload.encode('utf-8')).hexdigest()
+
+
+# Keys this process has loaded before. A later miss for the same key means
+# the memory cache expired or was cleared, so the disk copy is not reused.
+_disk_cache_seen = set()
+_disk_cache_seen_guard = threading.Lock()
+
+
+def _first_disk_load(key):
+    """True the first time key is loaded in this process"""
+    with _disk_cache_seen_guard:
+        if key in _disk_cache_seen:
+            return False
+        _disk_cache_seen.add(key)
+        return True
+
+
+def _disk_cache_dir(create=False):
+    """The cache directory, or None if it is missing or not private to us"""
+    try:
+        if create:
+            os.makedirs(_DISK_CACHE_DIR, mode=0o700, exist_ok=True)
+        info = os.stat(_DISK_CACHE_DIR)
+    except OSError:
+        return None
+    getuid = getattr(os, 'getuid', None)
+    if (getuid and info.st_uid != getuid()) or info.st_mode & 0o077:
+        logger.warning(f"Ignoring delivery disk cache: {_DISK_CACHE_DIR} is not private")
+        return None
+    return _DISK_CACHE_DIR
+
+
+def _read_disk_cache(key, ttl=_DISK_CACHE_TTL, newer_than=None):
+    """Return the cached DataFrame for key, or None if missing/stale/unreadable
+
+    With `newer_than`, only a file written after that timestamp is accepted.
+    """
+    cache_dir = _disk_cache_dir()
+    if cache_dir is None:
+        return None
+    path = os.path.join(cache_dir, f"{key}.parquet")
+    try:
+        mtime = os.path.getmtime(path)
+        if time.time() - mtime > ttl or (newer_than is not None and mtime < newer_than):
+            return None
+        return pd.read_parquet(path)
+    except Exception:
+        # Missing file, no parquet engine, or a corrupt file — just refetch
+        return None
+
+
+def _write_disk_cache(key, df):
+    """Write df atomically; failures are logged and otherwise ignored"""
+    cache_dir = _disk_cache_dir(create=True)
+    if cache_dir is None:
+        return
+    path = os.path.join(cache_dir, f"{key}.parquet")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        df.to_parquet(tmp_path, compression='zstd', index=False)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.warning(f"Could not write delivery disk cache: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+# ── In-flight query coordination ─────────────────────────────────
+
+_MAX_KEY_LOCKS = 256
+_key_locks = {}
+_key_locks_guard = threading.Lock()
+
+
+def _key_lock(key):
+    """Process-wide lock per cache key, so identical loads don't stampede"""
+    with _key_locks_guard:
+        lock = _key_locks.get(key)
+        if lock is None:
+            if len(_key_locks) >= _MAX_KEY_LOCKS:
+                # Forget locks nobody is holding
+                for stale_key in [k for k, l in _key_locks.items() if not l.locked()]:
+                    del _key_locks[stale_key]
+            lock = _key_locks[key] = threading.Lock()
+        return lock
+
+
+# ── Fixed queries (compiled once at import) ─────────────────
+
+# Unfiltered full projection — the initial page load
+_FULL_SELECT_SQL = text(f"""
+    SELECT {', '.join(ALL_COLUMNS)}
+    FROM {DELIVERY_SOURCE}
+    ORDER BY delivery_id DESC, sto_dr_line_id DESC
+""")
+
+# Overdue deliveries that need attention. The view only labels a line
+# 'Overdue' when shipment_status is not DELIVERED / ON_DELIVERY / DISPATCHED,
+# so no shipment_status predicate is needed (idx_dfm_overdue on the mat table).
+_OVERDUE_SQL = text(f"""
+    SELECT 
+        delivery_id,
+        dn_number,
+        customer,
+        recipient_company,
+        etd,
+        days_overdue,
+        remaining_quantity_to_deliver,
+        shipment_status,
+        shipment_status_vn,
+        fulfillment_status,
+        product_fulfillment_status,
+        created_by_name,
+        is_epe_company,
+        brand
+    FROM {DELIVERY_SOURCE}
+    WHERE delivery_timeline_status = 'Overdue'
+        AND remaining_quantity_to_deliver > 0
+    ORDER BY days_overdue DESC, delivery_id DESC
+    """)
+
+# Overdue / due-today line items for one sales person. Both statuses already
+# exclude DELIVERED in the view; COMPLETED is the only status left to drop
+# (idx_dfm_sales_urgent on the mat table).
+_SALES_URGENT_SQL = text(f"""
+    SELECT 
+        DATE(etd) as delivery_date,
+        customer,
+        customer_code,
+        recipient_company,
+        recipient_company_code,
+        recipient_contact,
+        recipient_contact_email,
+        recipient_contact_phone,
+        recipient_address,
+        recipient_state_province,
+        recipient_country_name,
+        delivery_id,
+        dn_number,
+        sto_dr_line_id,
+        oc_number,
+        oc_line_id,
+        product_pn,
+        product_id,
+        pt_code,
+        package_size,
+        brand,
+        standard_quantity,
+        selling_quantity,
+        uom_conversion,
+        remaining_quantity_to_deliver,
+        total_instock_at_preferred_warehouse,
+        total_instock_all_warehouses,
+        gap_quantity,
+        product_gap_quantity,
+        product_total_remaining_demand,
+        product_fulfill_rate_percent,
+        delivery_demand_percentage,
+        shipment_status,
+        shipment_status_vn,
+        fulfillment_status,
+        product_fulfillment_status,
+        delivery_timeline_status,
+        days_overdue,
+        preferred_warehouse,
+        is_epe_company,
+        legal_entity,
+        created_by_name,
+        created_date
+    FROM {DELIVERY_SOURCE}
+    WHERE created_by_name = :creator_name
+        AND delivery_timeline_status IN ('Overdue', 'Due Today')
+        AND remaining_quantity_to_deliver > 0
+        AND shipment_status != 'COMPLETED'
+    ORDER BY 
+        delivery_timeline_status DESC,  -- Overdue first, then Due Today
+        days_overdue DESC,              -- Most overdue first
+        delivery_date,
+        customer,
+        delivery_id,
+        sto_dr_line_id
+    """)
+
+# Foreign-by-country and EPE-by-location aggregates over one date window;
+# summary_type tells the two row sets apart (see get_customs_summaries)
+_CUSTOMS_SUMMARIES_SQL = text(f"""
+    SELECT 
+        'country' as summary_type,
+        customer_country_name as name,
+        customer_country_code as country_code,
+        COUNT(DISTINCT delivery_id) as deliveries,
+        COUNT(DISTINCT customer) as customers,
+        NULL as epe_companies,
+        SUM(remaining_quantity_to_deliver) as total_quantity,
+        COUNT(DISTINCT product_id) as products,
+        MIN(etd) as first_delivery,
+        MAX(etd) as last_delivery
+    FROM {DELIVERY_SOURCE}
+    WHERE etd >= :today
+        AND etd <= :end_date
+        AND remaining_quantity_to_deliver > 0
+        AND shipment_status NOT IN ('DELIVERED', 'COMPLETED')
+        AND customer_country_code != legal_entity_country_code
+    GROUP BY customer_country_name, customer_country_code
+    
+    UNION ALL
+    
+    SELECT 
+        'location' as summary_type,
+        recipient_state_province as name,
+        NULL as country_code,
+        COUNT(DISTINCT delivery_id) as deliveries,
+        COUNT(DISTINCT customer) as customers,
+        COUNT(DISTINCT recipient_company) as epe_companies,
+        SUM(remaining_quantity_to_deliver) as total_quantity,
+        COUNT(DISTINCT product_id) as products,
+        MIN(etd) as first_delivery,
+        MAX(etd) as last_delivery
+    FROM {DELIVERY_SOURCE}
+    WHERE etd >= :today
+        AND etd <= :end_date
+        AND remaining_quantity_to_deliver > 0
+        AND shipment_status NOT IN ('DELIVERED', 'COMPLETED')
+        AND is_epe_company = 'Yes'
+    GROUP BY recipient_state_province
+    """)
+
+# EPE + foreign line items between :today and :end_date
+_CUSTOMS_SCHEDULE_QUERY = f"""
+    SELECT DISTINCT
+        DATE(etd) as delivery_date,
+        etd,
+        customer,
+        customer_code,
+        customer_street,
+        customer_state_province,
+        customer_country_code,
+        customer_country_name,
+        recipient_company,
+        recipient_company_code,
+        recipient_contact,
+        recipient_contact_email,
+        recipient_contact_phone,
+        recipient_address,
+        recipient_state_province,
+        recipient_country_code,
+        recipient_country_name,
+        delivery_id,
+        dn_number,
+        sto_dr_line_id,
+        oc_number,
+        oc_line_id,
+        product_pn,
+        product_id,
+        pt_code,
+        package_size,
+        brand,
+        standard_quantity,
+        selling_quantity,
+        uom_conversion,
+        remaining_quantity_to_deliver,
+        total_instock_at_preferred_warehouse,
+        total_instock_all_warehouses,
+        gap_quantity,
+        product_gap_quantity,
+        product_total_remaining_demand,
+        product_fulfill_rate_percent,
+        delivery_demand_percentage,
+        shipment_status,
+        shipment_status_vn,
+        fulfillment_status,
+        product_fulfillment_status,
+        delivery_timeline_status,
+        days_overdue,
+        preferred_warehouse,
+        is_epe_company,
+        legal_entity,
+        legal_entity_code,
+        legal_entity_state_province,
+        legal_entity_country_code,
+        legal_entity_country_name,
+        created_by_name,
+        created_date,
+        -- Calculate customs type
+        CASE 
+            WHEN is_epe_company = 'Yes' THEN 'EPE'
+            WHEN customer_country_code != legal_entity_country_code THEN 'Foreign'
+            ELSE 'Domestic'
+        END as customs_type,
+        -- EPE location info
+        CASE 
+            WHEN is_epe_company = 'Yes' THEN 
+                CONCAT(recipient_state_province, ' - ', recipient_company)
+            ELSE NULL
+        END as epe_location
+    FROM {DELIVERY_SOURCE}
+    WHERE etd >= :today
+        AND etd <= :end_date
+        AND remaining_quantity_to_deliver > 0
+        AND shipment_status NOT IN ('DELIVERED', 'COMPLETED')
+        AND (
+            is_epe_company = 'Yes' 
+            OR customer_country_code != legal_entity_country_code
+        )
+    """
+
+_CUSTOMS_SCHEDULE_ORDER = """
+    ORDER BY 
+        customs_type,
+        CASE 
+            WHEN is_epe_company = 'Yes' THEN recipient_state_province
+            ELSE customer_country_name
+        END,
+        delivery_date,
+        customer,
+        delivery_id,
+        sto_dr_line_id
+    """
+
+# One statement per customs_type; the extra predicates mirror its CASE
+_CUSTOMS_SCHEDULE_SQL = {
+    None: text(_CUSTOMS_SCHEDULE_QUERY + _CUSTOMS_SCHEDULE_ORDER),
+    'EPE': text(_CUSTOMS_SCHEDULE_QUERY + " AND is_epe_company = 'Yes'" + _CUSTOMS_SCHEDULE_ORDER),
+    'Foreign': text(
+        _CUSTOMS_SCHEDULE_QUERY
+        + " AND NOT (is_epe_company <=> 'Yes')"
+        + " AND customer_country_code != legal_entity_country_code"
+        + _CUSTOMS_SCHEDULE_ORDER
+    ),
+}
+
+
 class DeliveryDataLoader:
     """Load and process delivery data from database"""
     
     def __init__(self):
         self.engine = get_db_engine()
+        self.table = DELIVERY_SOURCE
 
     # ── Cached base loader (new) ─────────────────────────────────
 
@@ -29,7 +639,7 @@ class DeliveryDataLoader:
         Every other filter is applied client-side on this cached result.
         """
         try:
-            query = """
+            query = f"""
             SELECT 
                 delivery_id, dn_number, created_by_email, created_by_name,
                 created_date, shipment_status, shipment_status_vn,
@@ -64,7 +674,7 @@ class DeliveryDataLoader:
                 legal_entity, legal_entity_code,
                 legal_entity_state_province, legal_entity_country_code,
                 legal_entity_country_name, preferred_warehouse
-            FROM delivery_full_view
+            FROM {_self.table}
             WHERE 1=1
             """
 
@@ -74,6 +684,7 @@ class DeliveryDataLoader:
             query += " ORDER BY delivery_id DESC, sto_dr_line_id DESC"
 
             with _self.engine.connect() as conn:
+                conn = conn.execution_options(stream_results=True, max_row_buffer=_FETCH_SIZE)
                 df = pd.read_sql(text(query), conn)
 
             logger.info(
@@ -248,226 +859,66 @@ class DeliveryDataLoader:
             logger.warning(f"get_etd_change_history: {e}")
             return pd.DataFrame()
 
-    @st.cache_data(ttl=300)  # Cache for 5 minutes
-    def load_delivery_data(_self, filters=None):
-        """Load delivery data from delivery_full_view"""
+    def load_delivery_data(self, filters=None, columns=None):
+        """Load delivery data from the delivery source (delivery_full_view by default)
+
+        The returned DataFrame is shared between callers — treat it as
+        read-only and call .copy() before mutating it.
+
+        Args:
+            filters: Optional dict of filter selections
+            columns: Optional list of column names to select (default: ALL_COLUMNS).
+                     Only names in ALL_COLUMNS are accepted; pass
+                     PIVOT_COLUMNS when the result only feeds a pivot.
+        """
+        if columns:
+            unknown = set(columns) - ALLOWED_COLUMNS
+            if unknown:
+                raise ValueError(f"Unknown delivery columns: {sorted(unknown)}")
+            columns = list(columns)
+
+        # Normalize list filters so equal selections share one cache entry
+        if filters:
+            filters = {
+                key: sorted(set(value)) if isinstance(value, (list, tuple, set)) else value
+                for key, value in filters.items()
+            }
+
+        # The string key is what Streamlit hashes; _filters is skipped
+        return self._load_delivery_data(_filter_key(filters), filters, columns)
+
+    # cache_resource: the frame is shared, not re-hashed/copied on each hit
+    @st.cache_resource(ttl=300)  # Cache for 5 minutes
+    def _load_delivery_data(_self, filter_key, _filters=None, columns=None):
+        """Cached worker for load_delivery_data (expects normalized args)
+
+        Keyed on `filter_key` (an MD5 of the filters, see _filter_key);
+        `_filters` carries the actual selections and is excluded from
+        Streamlit's hashing.
+
+        Backed by a Parquet file per (filters, columns) so a restarted
+        process can warm up without hitting the database. The file is only
+        trusted for a key's first load in this process; after a TTL expiry
+        or a _load_delivery_data.clear() the data comes from MySQL again.
+        """
         try:
-            # Base query - Updated with brand field
-            query = """
-            SELECT 
-                delivery_id,
-                dn_number,
-                created_by_email,
-                created_by_name,
-                created_date,
-                shipment_status,
-                shipment_status_vn,
-                dispatched_date,
-                delivered_date,
-                sto_delivery_status,
-                sto_etd_date,
-                is_delivered,
-                delivery_confirmed,
-                delivery_timeline_status,
-                days_overdue,
-                notify_email,
-                reference_packing_list,
-                shipping_cost,
-                total_weight,
-                
-                -- Order info
-                oc_id,
-                oc_number,
-                oc_date,
-                oc_line_id,
-                oc_product_pn,
-                standard_quantity,
-                selling_quantity,
-                uom_conversion,
-                etd,
-                
-                -- Product info
-                product_id,
-                product_pn,
-                pt_code,
-                package_size,
-                brand,
-                
-                -- Stock info
-                sto_dr_line_id,
-                selling_stock_out_quantity,
-                selling_stock_out_request_quantity,
-                stock_out_quantity,
-                stock_out_request_quantity,
-                stockin_line_id,
-                export_tax,
-                remaining_quantity_to_deliver,
-                total_instock_at_preferred_warehouse,
-                total_instock_all_warehouses,
-                gap_quantity,
-                fulfill_rate_percent,
-                fulfillment_status,
-                
-                -- New accurate gap analysis fields
-                product_total_remaining_demand,
-                product_active_delivery_count,
-                product_gap_quantity,
-                product_fulfill_rate_percent,
-                delivery_demand_percentage,
-                product_fulfillment_status,
-                
-                -- Customer info
-                customer,
-                customer_code,
-                customer_street,
-                customer_zip_code,
-                customer_state_province,
-                customer_country_code,
-                customer_country_name,
-                customer_contact,
-                customer_contact_email,
-                customer_contact_phone,
+            started = time.time()
+            cache_key = _disk_cache_key(filter_key, columns)
+            if _first_disk_load(cache_key):
+                df = _read_disk_cache(cache_key)
+                if df is not None:
+                    logger.info(f"Loaded {len(df)} delivery records from disk cache")
+                    return df
+            
+            # One query per key at a time; late arrivals reuse the winner's file
+            with _key_lock(cache_key):
+                df = _read_disk_cache(cache_key, newer_than=started)
+                if df is not None:
+                    logger.info(f"Loaded {len(df)} delivery records from disk cache")
+                    return df
                 
-                -- Recipient info
-                recipient_company,
-                recipient_company_code,
-                recipient_contact,
-                recipient_contact_email,
-                recipient_contact_phone,
-                recipient_address,
-                recipient_state_province,
-                recipient_country_code,
-                recipient_country_name,
-                
-                -- Other info
-                is_epe_company,
-                intl_charge,
-                local_charge,
-                legal_entity,
-                legal_entity_code,
-                legal_entity_state_province,
-                legal_entity_country_code,
-                legal_entity_country_name,
-                preferred_warehouse
-                
-            FROM delivery_full_view
-            WHERE 1=1
-            """
-            
-            # Apply filters if provided
-            params = {}
-            
-            if filters:
-                # Products filter with exclude option
-                if filters.get('products'):
-                    pt_codes = [p.split(' - ')[0] for p in filters['products']]
-                    if filters.get('exclude_products', False):
-                        query += " AND pt_code NOT IN :pt_codes"
-                    else:
-                        query += " AND pt_code IN :pt_codes"
-                    params['pt_codes'] = tuple(pt_codes)
-                
-                # Brand filter with exclude option
-                if filters.get('brands'):
-                    if filters.get('exclude_brands', False):
-                        query += " AND brand NOT IN :brands"
-                    else:
-                        query += " AND brand IN :brands"
-                    params['brands'] = tuple(filters['brands'])
-                    
-                # Date range
-                if filters.get('date_from'):
-                    query += " AND etd >= :date_from"
-                    params['date_from'] = filters['date_from']
-                
-                if filters.get('date_to'):
-                    query += " AND etd <= :date_to"
-                    params['date_to'] = filters['date_to']
-                
-                # Creators filter with exclude option
-                if filters.get('creators'):
-                    if filters.get('exclude_creators', False):
-                        query += " AND created_by_name NOT IN :creators"
-                    else:
-                        query += " AND created_by_name IN :creators"
-                    params['creators'] = tuple(filters['creators'])
-                
-                # Customers filter with exclude option
-                if filters.get('customers'):
-                    if filters.get('exclude_customers', False):
-                        query += " AND customer NOT IN :customers"
-                    else:
-                        query += " AND customer IN :customers"
-                    params['customers'] = tuple(filters['customers'])
-                
-                # Ship-to companies filter with exclude option
-                if filters.get('ship_to_companies'):
-                    if filters.get('exclude_ship_to_companies', False):
-                        query += " AND recipient_company NOT IN :ship_to_companies"
-                    else:
-                        query += " AND recipient_company IN :ship_to_companies"
-                    params['ship_to_companies'] = tuple(filters['ship_to_companies'])
-                
-                # States filter with exclude option
-                if filters.get('states'):
-                    if filters.get('exclude_states', False):
-                        query += " AND recipient_state_province NOT IN :states"
-                    else:
-                        query += " AND recipient_state_province IN :states"
-                    params['states'] = tuple(filters['states'])
-                
-                # Countries filter with exclude option
-                if filters.get('countries'):
-                    if filters.get('exclude_countries', False):
-                        query += " AND recipient_country_name NOT IN :countries"
-                    else:
-                        query += " AND recipient_country_name IN :countries"
-                    params['countries'] = tuple(filters['countries'])
-                
-                # Statuses filter with exclude option
-                if filters.get('statuses'):
-                    if filters.get('exclude_statuses', False):
-                        query += " AND shipment_status NOT IN :statuses"
-                    else:
-                        query += " AND shipment_status IN :statuses"
-                    params['statuses'] = tuple(filters['statuses'])
-                
-                # Legal entities filter with exclude option
-                if filters.get('legal_entities'):
-                    if filters.get('exclude_legal_entities', False):
-                        query += " AND legal_entity NOT IN :legal_entities"
-                    else:
-                        query += " AND legal_entity IN :legal_entities"
-                    params['legal_entities'] = tuple(filters['legal_entities'])
-                
-                # Timeline status filter with exclude option
-                if filters.get('timeline_status'):
-                    if filters.get('exclude_timeline_status', False):
-                        query += " AND delivery_timeline_status NOT IN :timeline_status"
-                    else:
-                        query += " AND delivery_timeline_status IN :timeline_status"
-                    params['timeline_status'] = tuple(filters['timeline_status'])
-                
-                # EPE Company filter (no exclude option needed as it's a radio button)
-                if filters.get('epe_filter'):
-                    if filters['epe_filter'] == 'EPE Companies Only':
-                        query += " AND is_epe_company = 'Yes'"
-                    elif filters['epe_filter'] == 'Non-EPE Companies Only':
-                        query += " AND is_epe_company = 'No'"
-                
-                # Foreign customer filter (no exclude option needed as it's a radio button)
-                if filters.get('foreign_filter'):
-                    if filters['foreign_filter'] == 'Foreign Only':
-                        query += " AND customer_country_code != legal_entity_country_code"
-                    elif filters['foreign_filter'] == 'Domestic Only':
-                        query += " AND customer_country_code = legal_entity_country_code"
-            
-            # Order by
-            query += " ORDER BY delivery_id DESC, sto_dr_line_id DESC"
-            
-            # Execute query
-            with _self.engine.connect() as conn:
-                df = pd.read_sql(text(query), conn, params=params)
+                df = _self._fetch_delivery_data(_filters, columns)
+                _write_disk_cache(cache_key, df)
             
             logger.info(f"Loaded {len(df)} delivery records")
             return df
@@ -477,20 +928,78 @@ class DeliveryDataLoader:
             st.error(f"Failed to load delivery data: {str(e)}")
             return pd.DataFrame()
 
-    def get_filter_options(self):
+    def _fetch_delivery_data(self, filters, columns):
+        """Run the delivery query (no caching)"""
+        if not filters and not columns:
+            return self._load_all()
+        return _with_json_table_fallback(
+            filters,
+            lambda use_json_table: self._load_filtered(filters, columns, use_json_table),
+        )
+
+    def _load_all(self):
+        """Every column, no filters — uses the precompiled _FULL_SELECT_SQL"""
+        return self._stream_frame(_FULL_SELECT_SQL, {}, ALL_COLUMNS)
+
+    def _load_filtered(self, filters, columns, use_json_table):
+        """Build and execute the filtered / projected delivery SELECT"""
+        columns = columns or ALL_COLUMNS
+        # Base query — projection limited to the requested columns
+        query = f"""
+        SELECT {', '.join(columns)}
+        FROM {self.table}
+        WHERE 1=1
+        """
+        
+        # Apply filters if provided
+        filter_sql, params, expanding = _build_filter_sql(filters, use_json_table)
+        query += filter_sql
+        
+        # Order by
+        query += " ORDER BY delivery_id DESC, sto_dr_line_id DESC"
+        
+        stmt = text(query).bindparams(
+            *[bindparam(key, expanding=True) for key in expanding]
+        )
+        return self._stream_frame(stmt, params, columns)
+
+    def _stream_frame(self, stmt, params, columns):
+        """Execute a delivery SELECT over a server-side cursor"""
+        with self.engine.connect() as conn:
+            conn = conn.execution_options(stream_results=True, max_row_buffer=_FETCH_SIZE)
+            # Build the frame chunk by chunk instead of from one big row buffer;
+            # date columns arrive as datetime64 so callers need no to_datetime
+            chunks = list(_read_sql(
+                stmt, conn, params=params, chunksize=_FETCH_SIZE,
+                parse_dates=[c for c in DATE_COLUMNS if c in columns],
+            ))
+        
+        if not chunks:
+            return pd.DataFrame(columns=list(columns))
+        # Arrow-backed chunks are stitched as chunked arrays, not copied;
+        # categoricals only after the concat so the categories line up
+        return _optimize_dtypes(pd.concat(chunks, ignore_index=True))
+
+    @st.cache_data(ttl=600, show_spinner=False)
+    def get_filter_options(_self):
         """Derive filter options from cached base data — zero extra DB queries.
 
         Uses load_base_data(include_completed=True) which is already cached.
         All DISTINCT values are extracted via pandas in sub-second time,
-        replacing the previous 11 separate SELECT DISTINCT queries.
+        replacing the previous 11 separate SELECT DISTINCT queries, so
+        there are no per-option statements or commits left to batch into
+        one transaction. The options themselves are cached too; call
+        get_filter_options.clear() to force a rebuild.
+
+        Raises instead of returning an empty fallback when the base data is
+        missing or unreadable, so a failure is not cached for 10 minutes.
         """
         try:
             # Reuse cached full dataset — no DB hit after first load
-            df = self.load_base_data(include_completed=True)
+            df = _self.load_base_data(include_completed=True)
 
             if df is None or df.empty:
-                logger.warning("[filter_options] No base data — returning empty options")
-                return {}
+                raise RuntimeError("No base data to derive filter options from")
 
             options = {}
 
@@ -515,20 +1024,22 @@ class DeliveryDataLoader:
                 else:
                     options[key] = []
 
-            # ── Products (CONCAT pt_code + product_pn) ───────────────
+            # ── Products (raw pt_code values + "pt_code - product_pn" labels)
             if 'pt_code' in df.columns and 'product_pn' in df.columns:
                 product_pairs = (
                     df[['pt_code', 'product_pn']]
                     .dropna()
-                    .drop_duplicates()
+                    .drop_duplicates('pt_code')
                     .sort_values('pt_code')
                 )
-                options['products'] = [
-                    f"{row['pt_code']} - {row['product_pn']}"
-                    for _, row in product_pairs.iterrows()
-                ]
+                pt_codes = product_pairs['pt_code'].astype(str)
+                options['products'] = pt_codes.tolist()
+                options['product_labels'] = dict(zip(
+                    pt_codes, pt_codes + ' - ' + product_pairs['product_pn'].astype(str)
+                ))
             else:
                 options['products'] = []
+                options['product_labels'] = {}
 
             # ── Date range (min/max ETD) ─────────────────────────────
             if 'etd' in df.columns:
@@ -562,12 +1073,12 @@ class DeliveryDataLoader:
             # ── Foreign / Domestic options ────────────────────────────
             foreign_options = ["All Customers"]
             if 'customer_country_code' in df.columns and 'legal_entity_country_code' in df.columns:
-                has_domestic = (
+                # One comparison pass; foreign is its complement
+                is_domestic = (
                     df['customer_country_code'] == df['legal_entity_country_code']
-                ).any()
-                has_foreign = (
-                    df['customer_country_code'] != df['legal_entity_country_code']
-                ).any()
+                )
+                has_domestic = is_domestic.any()
+                has_foreign = not is_domestic.all()
                 if has_domestic:
                     foreign_options.append("Domestic Only")
                 if has_foreign:
@@ -578,58 +1089,129 @@ class DeliveryDataLoader:
 
         except Exception as e:
             logger.error(f"Error getting filter options: {e}")
-            return {}
+            raise
+
+    def pivot_delivery_data(self, df=None, period='weekly', filters=None):
+        """Pivot delivery data by period (needs only PIVOT_COLUMNS)
 
-    def pivot_delivery_data(self, df, period='weekly'):
-        """Pivot delivery data by period"""
+        With df=None the aggregation runs in MySQL instead
+        (load_pivoted_delivery with the given filters).
+        """
+        if df is None:
+            return self.load_pivoted_delivery(filters, period)
+        
         try:
             if df.empty:
                 return pd.DataFrame()
             
-            # Ensure etd is datetime
-            df['etd'] = pd.to_datetime(df['etd'])
+            # etd is typed at read time; only foreign frames need converting
+            etd = df['etd']
+            if not pd.api.types.is_datetime64_any_dtype(etd):
+                etd = pd.to_datetime(etd, errors='coerce')
             
-            # Create period column
+            # Create period key (normalized timestamps, formatted after grouping)
             if period == 'daily':
-                df['period'] = df['etd'].dt.date
-                period_format = '%Y-%m-%d'
+                period_key = etd.dt.normalize()
             elif period == 'weekly':
-                df['period'] = df['etd'].dt.to_period('W').dt.start_time
-                period_format = 'Week of %Y-%m-%d'
+                period_key = etd.dt.to_period('W').dt.start_time
             else:  # monthly
-                df['period'] = df['etd'].dt.to_period('M').dt.start_time
-                period_format = '%B %Y'
-            
-            # Group by period and aggregate
-            pivot_df = df.groupby(['period', 'customer', 'recipient_company']).agg({
-                'delivery_id': 'count',
-                'standard_quantity': 'sum',
-                'remaining_quantity_to_deliver': 'sum',
-                'gap_quantity': 'sum',
-                'product_gap_quantity': 'sum',
-                'product_total_remaining_demand': 'sum'
+                period_key = etd.dt.to_period('M').dt.start_time
+            
+            # Group by period and aggregate (observed=True: no category cross-product)
+            pivot_df = df.groupby(
+                [period_key.rename('period'), df['customer'], df['recipient_company']],
+                observed=True, sort=False
+            ).agg(**{
+                'Deliveries': ('delivery_id', 'count'),
+                'Total Quantity': ('standard_quantity', 'sum'),
+                'Remaining to Deliver': ('remaining_quantity_to_deliver', 'sum'),
+                'Gap (Legacy)': ('gap_quantity', 'sum'),
+                'Product Gap': ('product_gap_quantity', 'sum'),
+                'Total Product Demand': ('product_total_remaining_demand', 'sum'),
             }).reset_index()
             
-            pivot_df.columns = ['Period', 'Customer', 'Ship To', 'Deliveries', 
-                               'Total Quantity', 'Remaining to Deliver', 'Gap (Legacy)',
-                               'Product Gap', 'Total Product Demand']
+            # Sorting the aggregated frame is cheaper than sorting during groupby
+            pivot_df = pivot_df.sort_values(
+                ['period', 'customer', 'recipient_company'], ignore_index=True
+            ).rename(columns={
+                'period': 'Period',
+                'customer': 'Customer',
+                'recipient_company': 'Ship To',
+            })
             
-            # Format period
-            pivot_df['Period'] = pd.to_datetime(pivot_df['Period']).dt.strftime(period_format)
+            # Format period — Period already holds timestamps, no re-parsing
+            pivot_df['Period'] = _format_period_labels(pivot_df['Period'], period)
             
             return pivot_df
             
         except Exception as e:
             logger.error(f"Error pivoting data: {e}")
             return pd.DataFrame()
+    def load_pivoted_delivery(self, filters=None, period='weekly'):
+        """Same output as pivot_delivery_data, aggregated in MySQL
+
+        Use when only the pivot is needed — returns one row per
+        (period, customer, ship-to) instead of every line item.
+        """
+        return self._load_pivoted_delivery(_filter_key(filters), filters, period)
+
+    @st.cache_data(ttl=300, show_spinner=False)
+    def _load_pivoted_delivery(_self, filter_key, _filters=None, period='weekly'):
+        """Cached worker for load_pivoted_delivery, keyed on filter_key"""
+        try:
+            period_expr = _PERIOD_SQL.get(period, _PERIOD_SQL['monthly'])
+            
+            def run(use_json_table):
+                filter_sql, params, expanding = _build_filter_sql(_filters, use_json_table)
+                
+                query = f"""
+                SELECT 
+                    {period_expr} AS period,
+                    customer,
+                    recipient_company,
+                    COUNT(delivery_id) AS deliveries,
+                    SUM(standard_quantity) AS total_quantity,
+                    SUM(remaining_quantity_to_deliver) AS remaining,
+                    SUM(gap_quantity) AS gap_legacy,
+                    SUM(product_gap_quantity) AS product_gap,
+                    SUM(product_total_remaining_demand) AS total_demand
+                FROM {_self.table}
+                WHERE etd IS NOT NULL
+                    AND customer IS NOT NULL
+                    AND recipient_company IS NOT NULL
+                    {filter_sql}
+                GROUP BY period, customer, recipient_company
+                ORDER BY period, customer, recipient_company
+                """
+                
+                stmt = text(query).bindparams(
+                    *[bindparam(key, expanding=True) for key in expanding]
+                )
+                with _self.engine.connect() as conn:
+                    return pd.read_sql(stmt, conn, params=params)
+            
+            pivot_df = _with_json_table_fallback(_filters, run)
+            
+            if pivot_df.empty:
+                return pd.DataFrame()
+            
+            pivot_df = pivot_df.rename(columns=_PIVOT_DISPLAY_NAMES)
+            pivot_df['Period'] = _format_period_labels(pd.to_datetime(pivot_df['Period']), period)
+            
+            return pivot_df
+            
+        except Exception as e:
+            logger.error(f"Error loading pivoted delivery data: {e}")
+            return pd.DataFrame()
    
-    def get_sales_delivery_summary(self, creator_name, weeks_ahead=4):
+    @st.cache_data(ttl=120, show_spinner=False)
+    def get_sales_delivery_summary(_self, creator_name, weeks_ahead=4):
         """Get delivery summary for a specific sales person - with line item details"""
         try:
             today = datetime.now().date()
             end_date = today + timedelta(weeks=weeks_ahead)
             
-            query = text("""
+            query = text(f"""
             SELECT 
                 DATE(etd) as delivery_date,
                 customer,
@@ -656,6 +1238,7 @@ class DeliveryDataLoader:
                 selling_quantity,
                 uom_conversion,
                 remaining_quantity_to_deliver,
+                remaining_quantity_to_deliver AS total_quantity,
                 total_instock_at_preferred_warehouse,
                 gap_quantity,
                 product_gap_quantity,
@@ -673,7 +1256,7 @@ class DeliveryDataLoader:
                 legal_entity,
                 created_by_name,
                 created_date
-            FROM delivery_full_view
+            FROM {_self.table}
             WHERE created_by_name = :creator_name
                 AND etd >= :today
                 AND etd <= :end_date
@@ -681,97 +1264,34 @@ class DeliveryDataLoader:
             ORDER BY delivery_date, customer, delivery_id, sto_dr_line_id
             """)
             
-            with self.engine.connect() as conn:
-                df = pd.read_sql(query, conn, params={
+            with _self.engine.connect() as conn:
+                df = _read_sql(query, conn, params={
                     'creator_name': creator_name,
                     'today': today,
                     'end_date': end_date
-                })
+                }, parse_dates=_SCHEDULE_DATE_COLUMNS)
             
-            # Check for duplicate columns
-            if not df.empty:
+            # Sanity check on the SELECT list — debug only
+            if logger.isEnabledFor(logging.DEBUG) and df.columns.duplicated().any():
                 duplicate_cols = df.columns[df.columns.duplicated()].tolist()
-                if duplicate_cols:
-                    logger.warning(f"Duplicate columns found in sales delivery summary: {duplicate_cols}")
-                    # Remove duplicates
-                    df = df.loc[:, ~df.columns.duplicated()]
-                
-                # Add total_quantity as alias for remaining_quantity_to_deliver
-                df['total_quantity'] = df['remaining_quantity_to_deliver']
+                logger.debug(f"Duplicate columns found in sales delivery summary: {duplicate_cols}")
+                df = df.loc[:, ~df.columns.duplicated()]
             
-            return df
+            return _optimize_dtypes(df)
             
         except Exception as e:
             logger.error(f"Error getting sales delivery summary: {e}")
             return pd.DataFrame()
     
     # All other methods remain the same...
-    def get_sales_urgent_deliveries(self, creator_name):
+    @st.cache_data(ttl=120, show_spinner=False)
+    def get_sales_urgent_deliveries(_self, creator_name):
         """Get overdue and due today deliveries for a specific sales person"""
         try:
-            query = text("""
-            SELECT 
-                DATE(etd) as delivery_date,
-                customer,
-                customer_code,
-                recipient_company,
-                recipient_company_code,
-                recipient_contact,
-                recipient_contact_email,
-                recipient_contact_phone,
-                recipient_address,
-                recipient_state_province,
-                recipient_country_name,
-                delivery_id,
-                dn_number,
-                sto_dr_line_id,
-                oc_number,
-                oc_line_id,
-                product_pn,
-                product_id,
-                pt_code,
-                package_size,
-                brand,
-                standard_quantity,
-                selling_quantity,
-                uom_conversion,
-                remaining_quantity_to_deliver,
-                total_instock_at_preferred_warehouse,
-                total_instock_all_warehouses,
-                gap_quantity,
-                product_gap_quantity,
-                product_total_remaining_demand,
-                product_fulfill_rate_percent,
-                delivery_demand_percentage,
-                shipment_status,
-                shipment_status_vn,
-                fulfillment_status,
-                product_fulfillment_status,
-                delivery_timeline_status,
-                days_overdue,
-                preferred_warehouse,
-                is_epe_company,
-                legal_entity,
-                created_by_name,
-                created_date
-            FROM delivery_full_view
-            WHERE created_by_name = :creator_name
-                AND delivery_timeline_status IN ('Overdue', 'Due Today')
-                AND remaining_quantity_to_deliver > 0
-                AND shipment_status NOT IN ('DELIVERED', 'COMPLETED')
-            ORDER BY 
-                delivery_timeline_status DESC,  -- Overdue first, then Due Today
-                days_overdue DESC,              -- Most overdue first
-                delivery_date,
-                customer,
-                delivery_id,
-                sto_dr_line_id
-            """)
-            
-            with self.engine.connect() as conn:
-                df = pd.read_sql(query, conn, params={
+            with _self.engine.connect() as conn:
+                df = _read_sql(_SALES_URGENT_SQL, conn, params={
                     'creator_name': creator_name
-                })
+                }, parse_dates=_SCHEDULE_DATE_COLUMNS)
             
             # Check for duplicate columns
             if not df.empty:
@@ -789,51 +1309,43 @@ class DeliveryDataLoader:
                 due_today_count = df[df['delivery_timeline_status'] == 'Due Today']['delivery_id'].nunique()
                 logger.info(f"Loaded {overdue_count} overdue and {due_today_count} due today deliveries for {creator_name}")
             
-            return df
+            return _optimize_dtypes(df)
             
         except Exception as e:
             logger.error(f"Error getting urgent deliveries: {e}")
             return pd.DataFrame()
     
-    def get_overdue_deliveries(self):
+    def clear_report_caches(self):
+        """Drop the short-lived report caches (e.g. after an ETD update)"""
+        for cached in (self.get_sales_delivery_summary, self.get_sales_urgent_deliveries,
+                       self.get_overdue_deliveries, self.get_product_demand_analysis,
+                       self.get_customs_clearance_summary, self.get_customs_clearance_schedule,
+                       self.get_customs_summaries):
+            cached.clear()
+    
+    @st.cache_data(ttl=120, show_spinner=False)
+    def get_overdue_deliveries(_self):
         """Get overdue deliveries that need attention"""
         try:
-            query = text("""
-            SELECT 
-                delivery_id,
-                dn_number,
-                customer,
-                recipient_company,
-                etd,
-                days_overdue,
-                remaining_quantity_to_deliver,
-                shipment_status,
-                shipment_status_vn,
-                fulfillment_status,
-                product_fulfillment_status,
-                created_by_name,
-                is_epe_company,
-                brand
-            FROM delivery_full_view
-            WHERE delivery_timeline_status = 'Overdue'
-                AND remaining_quantity_to_deliver > 0
-                AND shipment_status NOT IN ('DELIVERED', 'ON_DELIVERY', 'DISPATCHED')
-            ORDER BY days_overdue DESC, delivery_id DESC
-            """)
-            
-            with self.engine.connect() as conn:
-                df = pd.read_sql(query, conn)
+            with _self.engine.connect() as conn:
+                df = _read_sql(_OVERDUE_SQL, conn, parse_dates=['etd'])
             
-            return df
+            return _optimize_dtypes(df)
             
         except Exception as e:
             logger.error(f"Error getting overdue deliveries: {e}")
             return pd.DataFrame()
     
-    def get_product_demand_analysis(self, product_id=None):
-        """Get product demand analysis with accurate gap calculation"""
+    @st.cache_data(ttl=120, show_spinner=False)
+    def get_product_demand_analysis(_self, product_id=None, customers_top_n=0):
+        """Get product demand analysis with accurate gap calculation
+
+        Customer lists are not loaded by default — fetch them lazily with
+        get_product_customers(product_id) when a product is expanded, or
+        pass customers_top_n to stitch them for the top-N products.
+        """
         try:
-            query = """
+            query = f"""
             SELECT 
                 product_id,
                 product_pn,
@@ -844,9 +1356,8 @@ class DeliveryDataLoader:
                 MAX(total_instock_all_warehouses) as total_inventory,
                 MAX(product_gap_quantity) as gap_quantity,
                 MAX(product_fulfill_rate_percent) as fulfill_rate,
-                MAX(product_fulfillment_status) as fulfillment_status,
-                GROUP_CONCAT(DISTINCT customer SEPARATOR ', ') as customers
-            FROM delivery_full_view
+                MAX(product_fulfillment_status) as fulfillment_status
+            FROM {_self.table}
             WHERE remaining_quantity_to_deliver > 0
                 AND shipment_status != 'DELIVERED'
             """
@@ -858,8 +1369,20 @@ class DeliveryDataLoader:
             
             query += " GROUP BY product_id, product_pn, pt_code, brand ORDER BY total_remaining_demand DESC"
             
-            with self.engine.connect() as conn:
-                df = pd.read_sql(text(query), conn, params=params)
+            with _self.engine.connect() as conn:
+                df = _read_sql(text(query), conn, params=params)
+            
+            # Stitch customer lists for the products actually shown
+            df['customers'] = None
+            top_ids = df['product_id'].head(customers_top_n).dropna().unique().tolist()
+            if top_ids:
+                customers_df = _self.get_product_customers(top_ids)
+                if not customers_df.empty:
+                    customer_lists = (
+                        customers_df.groupby('product_id')['customer']
+                        .agg(lambda x: ', '.join(x.dropna().astype(str)))
+                    )
+                    df['customers'] = df['product_id'].map(customer_lists)
             
             return df
             
@@ -867,6 +1390,37 @@ class DeliveryDataLoader:
             logger.error(f"Error getting product demand analysis: {e}")
             return pd.DataFrame()
 
+    def get_product_customers(self, product_ids):
+        """Get (product_id, customer) pairs with open demand
+
+        Args:
+            product_ids: A single product_id or a list of them
+        """
+        try:
+            if not isinstance(product_ids, (list, tuple, set)):
+                product_ids = [product_ids] if product_ids is not None else []
+            if not product_ids:
+                return pd.DataFrame(columns=['product_id', 'customer'])
+            
+            query = text(f"""
+            SELECT product_id, customer
+            FROM {self.table}
+            WHERE product_id IN :product_ids
+                AND remaining_quantity_to_deliver > 0
+                AND shipment_status != 'DELIVERED'
+            GROUP BY product_id, customer
+            ORDER BY product_id, customer
+            """).bindparams(bindparam('product_ids', expanding=True))
+            
+            with self.engine.connect() as conn:
+                df = _read_sql(query, conn, params={'product_ids': list(product_ids)})
+            
+            return df
+            
+        except Exception as e:
+            logger.error(f"Error getting product customers: {e}")
+            return pd.DataFrame()
+
     def get_product_demand_from_dataframe(self, df):
         """Calculate product demand analysis from filtered dataframe"""
         try:
@@ -1009,134 +1563,50 @@ class DeliveryDataLoader:
     # All other methods remain the same (get_customs_clearance_summary, get_customs_clearance_schedule, etc.)
     # These methods don't need changes for the brand filter and exclude functionality
     
-    def get_customs_clearance_summary(self, weeks_ahead=4):
-        """Get summary of customs clearance deliveries (EPE + Foreign)"""
+    @st.cache_data(ttl=120, show_spinner=False)
+    def get_customs_clearance_summary(_self, weeks_ahead=4):
+        """Get summary of customs clearance deliveries (EPE + Foreign)
+
+        Derived from the (cached) customs schedule, which covers the same rows.
+        """
         try:
-            query = text("""
-            SELECT 
-                COUNT(DISTINCT CASE WHEN is_epe_company = 'Yes' THEN delivery_id END) as epe_deliveries,
-                COUNT(DISTINCT CASE WHEN customer_country_code != legal_entity_country_code THEN delivery_id END) as foreign_deliveries,
-                COUNT(DISTINCT CASE WHEN customer_country_code != legal_entity_country_code THEN customer_country_name END) as countries
-            FROM delivery_full_view
-            WHERE etd >= CURDATE()
-                AND etd <= DATE_ADD(CURDATE(), INTERVAL :weeks WEEK)
-                AND remaining_quantity_to_deliver > 0
-                AND shipment_status NOT IN ('DELIVERED', 'COMPLETED')
-                AND (is_epe_company = 'Yes' OR customer_country_code != legal_entity_country_code)
-            """)
+            df = _self.get_customs_clearance_schedule(weeks_ahead)
+            if df.empty:
+                return pd.DataFrame([{'epe_deliveries': 0, 'foreign_deliveries': 0, 'countries': 0}])
+            
+            # Compare as objects: the code columns are categoricals with
+            # different categories. NULL codes never count (as in SQL).
+            customer_cc = df['customer_country_code'].astype(object)
+            entity_cc = df['legal_entity_country_code'].astype(object)
+            is_foreign = (customer_cc.notna() & entity_cc.notna() & (customer_cc != entity_cc)).astype(bool)
+            is_epe = (df['is_epe_company'] == 'Yes').fillna(False).astype(bool)
             
-            with self.engine.connect() as conn:
-                result = conn.execute(query, {'weeks': weeks_ahead}).fetchone()
-                
             return pd.DataFrame([{
-                'epe_deliveries': result[0] or 0,
-                'foreign_deliveries': result[1] or 0,
-                'countries': result[2] or 0
+                'epe_deliveries': df.loc[is_epe, 'delivery_id'].nunique(),
+                'foreign_deliveries': df.loc[is_foreign, 'delivery_id'].nunique(),
+                'countries': df.loc[is_foreign, 'customer_country_name'].nunique()
             }])
             
         except Exception as e:
             logger.error(f"Error getting customs clearance summary: {e}")
             return pd.DataFrame()
 
-    def get_customs_clearance_schedule(self, weeks_ahead=4):
-        """Get customs clearance schedule for EPE and Foreign customers"""
+    @st.cache_data(ttl=120, show_spinner=False)
+    def get_customs_clearance_schedule(_self, weeks_ahead=4, customs_type=None):
+        """Get customs clearance schedule for EPE and Foreign customers
+
+        Args:
+            customs_type: 'EPE' or 'Foreign' to fetch only that slice (default: both)
+        """
         try:
             today = datetime.now().date()
             end_date = today + timedelta(weeks=weeks_ahead)
             
-            query = text("""
-            SELECT DISTINCT
-                DATE(etd) as delivery_date,
-                etd,
-                customer,
-                customer_code,
-                customer_street,
-                customer_state_province,
-                customer_country_code,
-                customer_country_name,
-                recipient_company,
-                recipient_company_code,
-                recipient_contact,
-                recipient_contact_email,
-                recipient_contact_phone,
-                recipient_address,
-                recipient_state_province,
-                recipient_country_code,
-                recipient_country_name,
-                delivery_id,
-                dn_number,
-                sto_dr_line_id,
-                oc_number,
-                oc_line_id,
-                product_pn,
-                product_id,
-                pt_code,
-                package_size,
-                brand,
-                standard_quantity,
-                selling_quantity,
-                uom_conversion,
-                remaining_quantity_to_deliver,
-                total_instock_at_preferred_warehouse,
-                total_instock_all_warehouses,
-                gap_quantity,
-                product_gap_quantity,
-                product_total_remaining_demand,
-                product_fulfill_rate_percent,
-                delivery_demand_percentage,
-                shipment_status,
-                shipment_status_vn,
-                fulfillment_status,
-                product_fulfillment_status,
-                delivery_timeline_status,
-                days_overdue,
-                preferred_warehouse,
-                is_epe_company,
-                legal_entity,
-                legal_entity_code,
-                legal_entity_state_province,
-                legal_entity_country_code,
-                legal_entity_country_name,
-                created_by_name,
-                created_date,
-                -- Calculate customs type
-                CASE 
-                    WHEN is_epe_company = 'Yes' THEN 'EPE'
-                    WHEN customer_country_code != legal_entity_country_code THEN 'Foreign'
-                    ELSE 'Domestic'
-                END as customs_type,
-                -- EPE location info
-                CASE 
-                    WHEN is_epe_company = 'Yes' THEN 
-                        CONCAT(recipient_state_province, ' - ', recipient_company)
-                    ELSE NULL
-                END as epe_location
-            FROM delivery_full_view
-            WHERE etd >= :today
-                AND etd <= :end_date
-                AND remaining_quantity_to_deliver > 0
-                AND shipment_status NOT IN ('DELIVERED', 'COMPLETED')
-                AND (
-                    is_epe_company = 'Yes' 
-                    OR customer_country_code != legal_entity_country_code
-                )
-            ORDER BY 
-                customs_type,
-                CASE 
-                    WHEN is_epe_company = 'Yes' THEN recipient_state_province
-                    ELSE customer_country_name
-                END,
-                delivery_date,
-                customer,
-                delivery_id,
-                sto_dr_line_id
-            """)
-            
-            with self.engine.connect() as conn:
-                df = pd.read_sql(query, conn, params={
+            with _self.engine.connect() as conn:
+                df = _read_sql(_CUSTOMS_SCHEDULE_SQL.get(customs_type, _CUSTOMS_SCHEDULE_SQL[None]), conn, params={
                     'today': today,
                     'end_date': end_date
-                })
+                }, parse_dates=_CUSTOMS_DATE_COLUMNS)
             
             # Debug: Log columns
             logger.info(f"Columns retrieved from customs query: {df.columns.tolist()}")
@@ -1157,7 +1627,7 @@ class DeliveryDataLoader:
                 foreign_count = df[df['customs_type'] == 'Foreign']['delivery_id'].nunique()
                 logger.info(f"Loaded {epe_count} EPE and {foreign_count} Foreign deliveries for customs clearance")
             
-            return df
+            return _optimize_dtypes(df)
             
         except Exception as e:
             logger.error(f"Error getting customs clearance schedule: {e}")
@@ -1166,100 +1636,63 @@ class DeliveryDataLoader:
     def get_customs_clearance_by_type(self, customs_type='EPE'):
         """Get customs clearance data filtered by type (EPE or Foreign)"""
         try:
-            df = self.get_customs_clearance_schedule()
+            # The type predicate runs in SQL; unknown types return both
+            df = self.get_customs_clearance_schedule(customs_type=customs_type)
             
             if df.empty:
                 return pd.DataFrame()
             
-            # Filter by customs type
-            if customs_type == 'EPE':
-                filtered_df = df[df['customs_type'] == 'EPE'].copy()
-            elif customs_type == 'Foreign':
-                filtered_df = df[df['customs_type'] == 'Foreign'].copy()
-            else:
-                filtered_df = df.copy()
-            
-            return filtered_df
+            return df
             
         except Exception as e:
             logger.error(f"Error filtering customs clearance by type: {e}")
             return pd.DataFrame()
 
-    def get_customs_country_summary(self, weeks_ahead=4):
-        """Get summary of foreign deliveries by country"""
+    @st.cache_data(ttl=120, show_spinner=False)
+    def get_customs_summaries(_self, weeks_ahead=4):
+        """Foreign-by-country and EPE-by-location summaries in one DB pass
+
+        Returns:
+            dict with 'country' and 'location' DataFrames
+        """
         try:
             today = datetime.now().date()
             end_date = today + timedelta(weeks=weeks_ahead)
             
-            query = text("""
-            SELECT 
-                customer_country_name as country,
-                customer_country_code as country_code,
-                COUNT(DISTINCT delivery_id) as deliveries,
-                COUNT(DISTINCT customer) as customers,
-                SUM(remaining_quantity_to_deliver) as total_quantity,
-                COUNT(DISTINCT product_id) as products,
-                MIN(etd) as first_delivery,
-                MAX(etd) as last_delivery
-            FROM delivery_full_view
-            WHERE etd >= :today
-                AND etd <= :end_date
-                AND remaining_quantity_to_deliver > 0
-                AND shipment_status NOT IN ('DELIVERED', 'COMPLETED')
-                AND customer_country_code != legal_entity_country_code
-            GROUP BY customer_country_name, customer_country_code
-            ORDER BY deliveries DESC, country
-            """)
-            
-            with self.engine.connect() as conn:
-                df = pd.read_sql(query, conn, params={
+            with _self.engine.connect() as conn:
+                df = _read_sql(_CUSTOMS_SUMMARIES_SQL, conn, params={
                     'today': today,
                     'end_date': end_date
-                })
-            
-            return df
+                }, parse_dates=['first_delivery', 'last_delivery'])
+            
+            is_country = df['summary_type'] == 'country'
+            country = (
+                df.loc[is_country, ['name', 'country_code', 'deliveries', 'customers',
+                                    'total_quantity', 'products', 'first_delivery', 'last_delivery']]
+                .rename(columns={'name': 'country'})
+                .sort_values(['deliveries', 'country'], ascending=[False, True])
+                .reset_index(drop=True)
+            )
+            location = (
+                df.loc[~is_country, ['name', 'deliveries', 'customers', 'epe_companies',
+                                     'total_quantity', 'products', 'first_delivery', 'last_delivery']]
+                .rename(columns={'name': 'location'})
+                .sort_values(['deliveries', 'location'], ascending=[False, True])
+                .reset_index(drop=True)
+            )
+            return {'country': country, 'location': location}
             
         except Exception as e:
-            logger.error(f"Error getting customs country summary: {e}")
-            return pd.DataFrame()
+            logger.error(f"Error getting customs summaries: {e}")
+            return {'country': pd.DataFrame(), 'location': pd.DataFrame()}
+
+    def get_customs_country_summary(self, weeks_ahead=4):
+        """Get summary of foreign deliveries by country"""
+        return self.get_customs_summaries(weeks_ahead)['country']
 
     def get_epe_location_summary(self, weeks_ahead=4):
         """Get summary of EPE deliveries by location/industrial zone"""
-        try:
-            today = datetime.now().date()
-            end_date = today + timedelta(weeks=weeks_ahead)
-            
-            query = text("""
-            SELECT 
-                recipient_state_province as location,
-                COUNT(DISTINCT delivery_id) as deliveries,
-                COUNT(DISTINCT customer) as customers,
-                COUNT(DISTINCT recipient_company) as epe_companies,
-                SUM(remaining_quantity_to_deliver) as total_quantity,
-                COUNT(DISTINCT product_id) as products,
-                MIN(etd) as first_delivery,
-                MAX(etd) as last_delivery
-            FROM delivery_full_view
-            WHERE etd >= :today
-                AND etd <= :end_date
-                AND remaining_quantity_to_deliver > 0
-                AND shipment_status NOT IN ('DELIVERED', 'COMPLETED')
-                AND is_epe_company = 'Yes'
-            GROUP BY recipient_state_province
-            ORDER BY deliveries DESC, location
-            """)
-            
-            with self.engine.connect() as conn:
-                df = pd.read_sql(query, conn, params={
-                    'today': today,
-                    'end_date': end_date
-                })
-            
-            return df
-            
-        except Exception as e:
-            logger.error(f"Error getting EPE location summary: {e}")
-            return pd.DataFrame()
+        return self.get_customs_summaries(weeks_ahead)['location']
             
     def get_customer_deliveries(self, customer_name, weeks_ahead=4):
         """Get delivery schedule for a specific customer"""
@@ -1267,7 +1700,7 @@ class DeliveryDataLoader:
             today = datetime.now().date()
             end_date = today + timedelta(weeks=weeks_ahead)
             
-            query = text("""
+            query = text(f"""
             SELECT 
                 DATE(etd) as delivery_date,
                 customer,
@@ -1314,7 +1747,7 @@ class DeliveryDataLoader:
                 legal_entity,
                 created_by_name,
                 created_date
-            FROM delivery_full_view
+            FROM {self.table}
             WHERE customer = :customer_name
                 AND etd >= :today
                 AND etd <= :end_date
@@ -1324,11 +1757,11 @@ class DeliveryDataLoader:
             """)
             
             with self.engine.connect() as conn:
-                df = pd.read_sql(query, conn, params={
+                df = _read_sql(query, conn, params={
                     'customer_name': customer_name,
                     'today': today,
                     'end_date': end_date
-                })
+                }, parse_dates=_SCHEDULE_DATE_COLUMNS)
             
             # Add total_quantity alias
             if not df.empty:
@@ -1346,7 +1779,7 @@ class DeliveryDataLoader:
             today = datetime.now().date()
             end_date = today + timedelta(weeks=weeks_ahead)
             
-            query = text("""
+            query = text(f"""
             SELECT 
                 DATE(etd) as delivery_date,
                 customer,
@@ -1393,7 +1826,7 @@ class DeliveryDataLoader:
                 legal_entity,
                 created_by_name,
                 created_date
-            FROM delivery_full_view
+            FROM {self.table}
             WHERE etd >= :today
                 AND etd <= :end_date
                 AND remaining_quantity_to_deliver > 0
@@ -1402,10 +1835,10 @@ class DeliveryDataLoader:
             """)
             
             with self.engine.connect() as conn:
-                df = pd.read_sql(query, conn, params={
+                df = _read_sql(query, conn, params={
                     'today': today,
                     'end_date': end_date
-                })
+                }, parse_dates=_SCHEDULE_DATE_COLUMNS)
             
             # Add total_quantity alias
             if not df.empty:
@@ -1420,7 +1853,7 @@ class DeliveryDataLoader:
     def get_all_urgent_deliveries(self):
         """Get all urgent deliveries (overdue and due today) for custom recipients"""
         try:
-            query = text("""
+            query = text(f"""
             SELECT 
                 DATE(etd) as delivery_date,
                 customer,
@@ -1468,7 +1901,7 @@ class DeliveryDataLoader:
                 legal_entity,
                 created_by_name,
                 created_date
-            FROM delivery_full_view
+            FROM {self.table}
             WHERE delivery_timeline_status IN ('Overdue', 'Due Today')
                 AND remaining_quantity_to_deliver > 0
                 AND shipment_status NOT IN ('DELIVERED', 'COMPLETED')
@@ -1482,7 +1915,7 @@ class DeliveryDataLoader:
             """)
             
             with self.engine.connect() as conn:
-                df = pd.read_sql(query, conn)
+                df = _read_sql(query, conn, parse_dates=_SCHEDULE_DATE_COLUMNS)
             
             # Add total_quantity alias
             if not df.empty:
@@ -1577,12 +2010,12 @@ class DeliveryDataLoader:
                   AND status = 'SUCCESS'
             """)
             with self.engine.connect() as conn:
-                row = conn.execute(query, {
+                count, last_time = conn.execute(query, {
                     'email': recipient_email, 'ntype': notification_type,
-                }).fetchone()
+                }).one()
 
-            if row and row[0] > 0:
-                return True, row[1]
+            if count > 0:
+                return True, last_time
             return False, None
 
         except Exception as e:
@@ -563,6 +563,8 @@ def _execute_etd_updates(changes, display_df, data_loader, email_sender, reason=
 
         # Clear cache so next load picks up new ETD
         data_loader.load_base_data.clear()
+        data_loader.get_filter_options.clear()
+        data_loader.clear_report_caches()
 
     if errors:
         st.error("Some updates failed:\n" + "\n".join(errors))
@@ -24,6 +24,7 @@ import pandas as pd
 from datetime import datetime
 from sqlalchemy import text
 from .permissions import can_send_email
+from .data_loader import DELIVERY_SOURCE
 import re
 import logging
 
@@ -158,7 +159,7 @@ def display_email_notifications(data_loader, email_sender):
 @st.cache_data(ttl=300)
 def _get_sales_list(_engine, weeks_ahead=4):
     """Sales people with active deliveries."""
-    query = text("""
+    query = text(f"""
     SELECT DISTINCT
         e.id, CONCAT(e.first_name, ' ', e.last_name) as name, e.email,
         COUNT(DISTINCT d.delivery_id) as active_deliveries,
@@ -168,7 +169,7 @@ def _get_sales_list(_engine, weeks_ahead=4):
         m.email as manager_email
     FROM employees e
     LEFT JOIN employees m ON e.manager_id = m.id
-    INNER JOIN delivery_full_view d ON d.created_by_email = e.email
+    INNER JOIN {DELIVERY_SOURCE} d ON d.created_by_email = e.email
     WHERE d.etd >= CURDATE()
       AND d.etd <= DATE_ADD(CURDATE(), INTERVAL :weeks WEEK)
       AND d.remaining_quantity_to_deliver > 0
@@ -183,7 +184,7 @@ def _get_sales_list(_engine, weeks_ahead=4):
 @st.cache_data(ttl=300)
 def _get_sales_list_overdue(_engine):
     """Sales with overdue/due-today deliveries."""
-    query = text("""
+    query = text(f"""
     SELECT DISTINCT
         e.id, CONCAT(e.first_name, ' ', e.last_name) as name, e.email,
         COUNT(DISTINCT CASE WHEN d.delivery_timeline_status = 'Overdue'
@@ -194,7 +195,7 @@ def _get_sales_list_overdue(_engine):
         m.email as manager_email
     FROM employees e
     LEFT JOIN employees m ON e.manager_id = m.id
-    INNER JOIN delivery_full_view d ON d.created_by_email = e.email
+    INNER JOIN {DELIVERY_SOURCE} d ON d.created_by_email = e.email
     WHERE d.delivery_timeline_status IN ('Overdue', 'Due Today')
       AND d.remaining_quantity_to_deliver > 0
       AND d.shipment_status NOT IN ('DELIVERED', 'COMPLETED')
@@ -209,13 +210,13 @@ def _get_sales_list_overdue(_engine):
 @st.cache_data(ttl=300)
 def _get_customers_with_deliveries(_engine, weeks_ahead=4):
     """Customers with active deliveries."""
-    query = text("""
+    query = text(f"""
     SELECT DISTINCT
         d.customer, d.customer_code,
         COUNT(DISTINCT d.delivery_id) as active_deliveries,
         SUM(d.remaining_quantity_to_deliver) as total_quantity,
         COUNT(DISTINCT d.recipient_state_province) as provinces_count
-    FROM delivery_full_view d
+    FROM {DELIVERY_SOURCE} d
     WHERE d.etd >= CURDATE()
       AND d.etd <= DATE_ADD(CURDATE(), INTERVAL :weeks WEEK)
       AND d.remaining_quantity_to_deliver > 0
@@ -232,7 +233,7 @@ def _get_customer_contacts(_engine, customer_names, weeks_ahead=4):
     """Contacts for selected customers — weeks_ahead is now dynamic."""
     if not customer_names:
         return pd.DataFrame()
-    query = text("""
+    query = text(f"""
     SELECT DISTINCT
         CONCAT(d.customer, '_', COALESCE(d.customer_contact_email, 'no_email'), '_',
                COALESCE(d.customer_contact, 'Unknown')) as contact_id,
@@ -240,7 +241,7 @@ def _get_customer_contacts(_engine, customer_names, weeks_ahead=4):
         COALESCE(d.customer_contact, 'Unknown Contact') as contact_name,
         d.customer_contact_email as email,
         COUNT(DISTINCT d.delivery_id) as delivery_count
-    FROM delivery_full_view d
+    FROM {DELIVERY_SOURCE} d
     WHERE d.customer IN :customers
       AND d.etd >= CURDATE()
       AND d.etd <= DATE_ADD(CURDATE(), INTERVAL :weeks WEEK)
@@ -643,11 +644,13 @@ def _render_actions(data_loader, email_sender, notif_type, recip_type,
 
     # ── Send execution (full width below) ────────────────────────
     if do_send:
-        results, errors = _execute_send(
-            data_loader, email_sender, notif_type, recip_type,
-            selected, contacts, custom, customs_to,
-            sales_df, cc_emails, weeks,
-        )
+        # One SMTP session serves every recipient in the run
+        with email_sender:
+            results, errors = _execute_send(
+                data_loader, email_sender, notif_type, recip_type,
+                selected, contacts, custom, customs_to,
+                sales_df, cc_emails, weeks,
+            )
         _show_results(results, errors)
 
 
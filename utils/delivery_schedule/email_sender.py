@@ -4,17 +4,713 @@ import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
+from email.mime.application import MIMEApplication
 from email import encoders
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
+from html import escape
 import logging
 import io
 import os
+import re
+import threading
+from collections import OrderedDict
+from functools import wraps
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from .calendar_utils import CalendarEventGenerator
 from ..config import OUTBOUND_EMAIL_CONFIG
 
 logger = logging.getLogger(__name__)
 
+# Implicit-TLS submission port — TLS from the first byte, no STARTTLS round-trip
+SMTP_SSL_PORT = 465
+
+# Concurrent SMTP sessions used by send_bulk_delivery_schedules
+BULK_SEND_WORKERS = 8
+
+# Rendered e-mail bodies kept for repeat renders of the same data
+HTML_CACHE_SIZE = 128
+
+# Result message for recipients skipped because they have no deliveries
+NO_DELIVERIES_MESSAGE = "Skipped: no deliveries"
+
+# xlsxwriter streams each row to disk in this mode; rows must be written in order.
+# Text that looks like a URL stays text (no per-cell URL matching or link limits).
+EXCEL_WRITER_KWARGS = {
+    'options': {
+        'constant_memory': True,
+        'default_date_format': 'yyyy-mm-dd',
+        'strings_to_urls': False,
+    }
+}
+
+
+def _write_sheet(workbook, sheet_name, df, header_format, row_formats=None):
+    """Write df to a new worksheet row by row (constant_memory safe)
+
+    DataFrame.to_excel emits cells column by column, which constant_memory
+    mode would silently drop, so rows are written here instead. Rows are
+    flushed as they go, so highlighting is passed in as row_formats (one
+    format or None per row) rather than applied afterwards.
+    """
+    worksheet = workbook.add_worksheet(sheet_name)
+    worksheet.write_row(0, 0, [str(col) for col in df.columns], header_format)
+    # NaN / NA / NaT become blank cells
+    values = df.astype(object).where(df.notna(), None)
+    if row_formats is None:
+        row_formats = [None] * len(df)
+    rows = values.itertuples(index=False, name=None)
+    for row_idx, (row, row_format) in enumerate(zip(rows, row_formats), start=1):
+        worksheet.write_row(row_idx, 0, row, row_format)
+    return worksheet
+
+
+# ── Rendered HTML cache ──
+# Streamlit reruns re-render the preview, and a retried run re-renders every
+# body; both hit this cache as long as the frame's contents are unchanged.
+
+_html_cache = OrderedDict()
+_html_cache_lock = threading.Lock()
+
+
+def _frame_fingerprint(df):
+    """Content key for df: shape, columns and a hash of every value"""
+    return df.shape, tuple(df.columns), int(pd.util.hash_pandas_object(df, index=False).sum())
+
+
+def _memoize_html(build):
+    """Cache an EmailSender HTML builder on (data fingerprint, other args)"""
+    @wraps(build)
+    def wrapper(self, delivery_df, *args, **kwargs):
+        try:
+            key = (build.__name__, _frame_fingerprint(delivery_df), args, tuple(sorted(kwargs.items())))
+            hash(key)
+        except (TypeError, ValueError):
+            # Cell values pandas cannot hash — render without caching
+            return build(self, delivery_df, *args, **kwargs)
+        
+        with _html_cache_lock:
+            if key in _html_cache:
+                _html_cache.move_to_end(key)
+                return _html_cache[key]
+        
+        html = build(self, delivery_df, *args, **kwargs)
+        with _html_cache_lock:
+            _html_cache[key] = html
+            if len(_html_cache) > HTML_CACHE_SIZE:
+                _html_cache.popitem(last=False)
+        return html
+    return wrapper
+
+
+def clear_html_cache():
+    """Drop all cached e-mail bodies"""
+    with _html_cache_lock:
+        _html_cache.clear()
+
+
+def _as_datetime(values):
+    """values as datetime64, skipping the pd.to_datetime scan when already parsed"""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    return pd.to_datetime(values)
+
+
+def _count_ids(ids):
+    """Number of distinct values in an ID column (delivery_id, product_id)
+
+    IDs are never null, so pd.unique over the raw array gives the count
+    without nunique's null handling.
+    """
+    return len(pd.unique(ids.to_numpy()))
+
+
+def _with_parsed_dates(delivery_df):
+    """Shallow copy of delivery_df with a datetime64 delivery_date
+
+    Frames already parsed (e.g. by send_delivery_schedule_email before it
+    fans out to the HTML / ICS / Excel builders) are not converted again.
+    """
+    df = delivery_df.copy(deep=False)
+    df['delivery_date'] = _as_datetime(df['delivery_date'])
+    return df
+
+
+# Display strings for the schedule table, keyed by their source column.
+# Quantities are summed per table row, so they are formatted after grouping.
+PREFORMATTED_COLUMNS = {
+    '_date_s': 'delivery_date',
+    '_dn_s': 'dn_number',
+    '_customer_s': 'customer',
+    '_ship_to_s': 'recipient_company',
+    '_loc_s': 'recipient_state_province',
+    '_pt_s': 'pt_code',
+    '_product_s': 'product_pn',
+}
+
+
+def preformat_schedule_columns(delivery_df):
+    """Return a shallow copy of delivery_df with the schedule display strings
+
+    Run once on a parent frame before slicing it per recipient;
+    create_delivery_schedule_html then reuses the strings instead of
+    formatting and escaping them again for every e-mail.
+    """
+    df = delivery_df.copy(deep=False)
+    df['_date_s'] = _as_datetime(df['delivery_date']).dt.strftime('%b %d')
+    for target, source in PREFORMATTED_COLUMNS.items():
+        if target == '_date_s':
+            continue
+        values = df[source].astype(object)
+        if source == 'recipient_state_province':
+            values = values.fillna('')
+        df[target] = values.astype(str).map(escape)
+    return df
+
+
+# RFC 5322 line limit; 8bit bodies must stay within it
+SMTP_MAX_LINE_BYTES = 998
+
+
+def _ics_part(ics_content):
+    """Build the text/calendar MIME part for ics_content
+
+    The UTF-8 text goes out as 8bit (no base64 inflation) unless a line
+    exceeds the SMTP limit; _send_message falls back to base64 for servers
+    without 8BITMIME.
+    """
+    payload = ics_content.encode('utf-8')
+    ics_part = MIMEBase('text', 'calendar', charset='utf-8')
+    ics_part.set_payload(payload)
+    if max(map(len, payload.splitlines()), default=0) <= SMTP_MAX_LINE_BYTES:
+        encoders.encode_7or8bit(ics_part)
+    else:
+        encoders.encode_base64(ics_part)
+    return ics_part
+
+
+def _xlsx_part(excel_data):
+    """Build the .xlsx MIME part straight from the BytesIO buffer
+
+    The workbook bytes are base64-encoded once from a memoryview, without
+    first being read out into a separate bytes copy.
+    """
+    return MIMEApplication(
+        excel_data.getbuffer(), _subtype='vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+
+
+def _minify_style(html):
+    """Collapse whitespace inside <style> blocks (run once at import)
+
+    The style sheets are sent with every e-mail; indentation and line
+    breaks are about a third of their size.
+    """
+    def minify(match):
+        css = re.sub(r'\s+', ' ', match.group(2))
+        css = re.sub(r'\s*([{};:,])\s*', r'\1', css).strip()
+        return f'{match.group(1)}{css}{match.group(3)}'
+    return re.sub(r'(<style>)(.*?)(</style>)', minify, html, flags=re.S)
+
+
+# ── Static HTML for create_overdue_alerts_html (built once at import) ──
+
+# Columns read by the overdue / due-today table rows
+_ALERT_ROW_COLUMNS = [
+    'days_overdue', 'delivery_date', 'customer', 'recipient_company', 'pt_code',
+    'product_pn', 'remaining_quantity_to_deliver', 'dn_number',
+]
+
+
+def _alert_rows(display_df):
+    """Rows of an alert table as plain dicts, dates and numbers pre-formatted
+
+    Formatting runs column-wise before the emit loop; only the columns the
+    row template reads are materialised. The fulfillment column is chosen
+    once per table (product-level status first) along with its CSS class.
+    """
+    rows_df = display_df[[col for col in _ALERT_ROW_COLUMNS if col in display_df.columns]].copy()
+    fulfill_col = next(
+        (col for col in ('product_fulfillment_status', 'fulfillment_status') if col in display_df.columns),
+        None,
+    )
+    if fulfill_col is None:
+        rows_df['fulfillment'] = 'Unknown'
+    else:
+        rows_df['fulfillment'] = display_df[fulfill_col].astype(object).fillna('Unknown')
+    rows_df['fulfillment_class'] = np.where(rows_df['fulfillment'] == 'Out of Stock', 'out-of-stock', '')
+    if 'days_overdue' in rows_df.columns:
+        rows_df['days_overdue'] = rows_df['days_overdue'].fillna(0).astype(int)
+    rows_df['delivery_date'] = rows_df['delivery_date'].dt.strftime('%Y-%m-%d')
+    rows_df['remaining_quantity_to_deliver'] = rows_df['remaining_quantity_to_deliver'].map('{:,.0f}'.format)
+    return rows_df.to_dict('records')
+
+
+_OVERDUE_HTML_HEAD = """
+<!DOCTYPE html>
+<html>
+<head>
+    <style>
+        body {
+            font-family: Arial, sans-serif;
+            line-height: 1.6;
+            color: #333;
+        }
+        .header {
+            background-color: #d32f2f;
+            color: white;
+            padding: 20px;
+            text-align: center;
+        }
+        .content {
+            padding: 20px;
+        }
+        .alert-box {
+            background-color: #ffebee;
+            border: 2px solid #ef5350;
+            border-radius: 5px;
+            padding: 15px;
+            margin: 20px 0;
+        }
+        .summary-grid {
+            display: table;
+            width: 100%;
+            margin: 20px 0;
+        }
+        .summary-item {
+            display: table-cell;
+            text-align: center;
+            padding: 10px;
+        }
+        .metric-value {
+            font-size: 36px;
+            font-weight: bold;
+            color: #d32f2f;
+        }
+        .metric-label {
+            font-size: 14px;
+            color: #666;
+            margin-top: 5px;
+        }
+        .section-header {
+            background-color: #f5f5f5;
+            padding: 10px;
+            margin: 20px 0 10px 0;
+            border-left: 4px solid #d32f2f;
+            font-weight: bold;
+            font-size: 18px;
+        }
+        table {
+            width: 100%;
+            border-collapse: collapse;
+            margin-top: 10px;
+        }
+        th, td {
+            padding: 8px;
+            text-align: left;
+            border-bottom: 1px solid #ddd;
+        }
+        th {
+            background-color: #f8f9fa;
+            font-weight: bold;
+        }
+        .overdue-row {
+            background-color: #ffcccb;
+        }
+        .due-today-row {
+            background-color: #ffe4b5;
+        }
+        .out-of-stock {
+            color: #d32f2f;
+            font-weight: bold;
+        }
+        .days-overdue {
+            color: #d32f2f;
+            font-weight: bold;
+            font-size: 16px;
+        }
+        .action-box {
+            background-color: #e3f2fd;
+            border: 1px solid #2196f3;
+            border-radius: 5px;
+            padding: 15px;
+            margin: 20px 0;
+        }
+        .footer {
+            margin-top: 30px;
+            padding: 20px;
+            background-color: #f8f9fa;
+            text-align: center;
+            font-size: 12px;
+            color: #666;
+        }
+    </style>
+</head>
+<body>
+    <div class="header">
+        <h1>🚨 URGENT DELIVERY ALERT</h1>
+        <p>Immediate Action Required</p>
+    </div>
+
+    <div class="content">
+"""
+_OVERDUE_HTML_HEAD = _minify_style(_OVERDUE_HTML_HEAD)
+
+_OVERDUE_TABLE_HEAD = """
+<div class="section-header">🔴 OVERDUE DELIVERIES</div>
+<p>These deliveries are past their expected delivery date and need immediate attention:</p>
+<table>
+    <tr>
+        <th width="80">Days Overdue</th>
+        <th width="100">Delivery Date</th>
+        <th width="150">Customer</th>
+        <th width="150">Ship To</th>
+        <th width="80">PT Code</th>
+        <th width="120">Product</th>
+        <th width="80">Quantity</th>
+        <th width="100">Fulfillment</th>
+        <th width="120">DN Number</th>
+    </tr>
+"""
+
+_DUE_TODAY_TABLE_HEAD = """
+<div class="section-header">🟡 DUE TODAY</div>
+<p>These deliveries are scheduled for today and should be prioritized:</p>
+<table>
+    <tr>
+        <th width="100">Delivery Date</th>
+        <th width="150">Customer</th>
+        <th width="150">Ship To</th>
+        <th width="80">PT Code</th>
+        <th width="120">Product</th>
+        <th width="80">Quantity</th>
+        <th width="100">Fulfillment</th>
+        <th width="120">DN Number</th>
+    </tr>
+"""
+
+_OVERDUE_HTML_FOOTER = """
+    <div class="action-box">
+        <h3>📋 Required Actions:</h3>
+        <ol>
+            <li><strong>Contact Customers:</strong> Inform customers about delivery delays and provide updated ETAs</li>
+            <li><strong>Coordinate with Warehouse:</strong> Check inventory availability for out-of-stock items</li>
+            <li><strong>Update Delivery Status:</strong> Ensure all delivery statuses are current in the system</li>
+            <li><strong>Escalate if Needed:</strong> For deliveries overdue by 5+ days, escalate to management</li>
+        </ol>
+
+        <p><strong>Logistics Team Contact:</strong><br>
+        📧 Email: outbound@prostech.vn<br>
+        📞 Phone: +84 33 476273</p>
+    </div>
+
+    <div class="footer">
+        <p>This is an automated urgent alert from Outbound Logistics System</p>
+        <p>Please take immediate action on the items listed above</p>
+        <p>For questions, contact: <a href="mailto:outbound@prostech.vn">outbound@prostech.vn</a></p>
+    </div>
+</div>
+</body>
+</html>
+"""
+
+
+# ── Static HTML for create_delivery_schedule_html (built once at import) ──
+
+_SCHEDULE_HTML_HEAD = """
+<!DOCTYPE html>
+<html>
+<head>
+    <style>
+        body {
+            font-family: Arial, sans-serif;
+            line-height: 1.6;
+            color: #333;
+        }
+        .header {
+            background-color: #1f77b4;
+            color: white;
+            padding: 20px;
+            text-align: center;
+        }
+        .content {
+            padding: 20px;
+        }
+        .week-section {
+            margin-bottom: 30px;
+            border: 1px solid #ddd;
+            border-radius: 5px;
+            padding: 15px;
+        }
+        .week-header {
+            background-color: #f0f2f6;
+            padding: 10px;
+            margin: -15px -15px 15px -15px;
+            border-radius: 5px 5px 0 0;
+            font-weight: bold;
+        }
+        table {
+            width: 100%;
+            border-collapse: collapse;
+            margin-top: 10px;
+        }
+        th, td {
+            padding: 8px;
+            text-align: left;
+            border-bottom: 1px solid #ddd;
+        }
+        th {
+            background-color: #f8f9fa;
+            font-weight: bold;
+        }
+        .urgent {
+            color: #d32f2f;
+            font-weight: bold;
+        }
+        .overdue {
+            background-color: #ffcccb;
+            font-weight: bold;
+        }
+        .warning {
+            background-color: #fff3cd;
+            padding: 10px;
+            border-radius: 5px;
+            margin: 10px 0;
+        }
+        .footer {
+            margin-top: 30px;
+            padding: 20px;
+            background-color: #f8f9fa;
+            text-align: center;
+            font-size: 12px;
+            color: #666;
+        }
+        .metric-box {
+            display: inline-block;
+            background-color: #f0f2f6;
+            padding: 15px;
+            margin: 10px;
+            border-radius: 5px;
+            text-align: center;
+        }
+        .metric-value {
+            font-size: 24px;
+            font-weight: bold;
+            color: #1f77b4;
+        }
+        .metric-label {
+            font-size: 12px;
+            color: #666;
+            margin-top: 5px;
+        }
+    </style>
+</head>
+"""
+_SCHEDULE_HTML_HEAD = _minify_style(_SCHEDULE_HTML_HEAD)
+
+_SCHEDULE_HTML_FOOTER = """
+    <div style="margin-top: 20px; padding: 15px; background-color: #f8f9fa; border-radius: 5px;">
+        <h4>Fulfillment Status:</h4>
+        <p>• <strong>Can Fulfill All:</strong> Sufficient inventory for all deliveries<br>
+        • <strong>Can Fulfill Partial:</strong> Limited inventory available<br>
+        • <strong>Out of Stock:</strong> No inventory available</p>
+    </div>
+        <div class="footer">
+            <p>This is an automated email from Outbound Logistics System</p>
+            <p>For questions, please contact: <a href="mailto:outbound@prostech.vn">outbound@prostech.vn</a></p>
+        </div>
+    </div>
+</body>
+</html>
+"""
+
+
+# ── Static HTML for create_customs_clearance_html (built once at import) ──
+
+_CUSTOMS_HTML_HEAD = """
+<!DOCTYPE html>
+<html>
+<head>
+    <style>
+        body {
+            font-family: Arial, sans-serif;
+            line-height: 1.6;
+            color: #333;
+        }
+        .header {
+            background-color: #00796b;
+            color: white;
+            padding: 20px;
+            text-align: center;
+        }
+        .content {
+            padding: 20px;
+        }
+        .summary-section {
+            background-color: #f5f5f5;
+            border-radius: 5px;
+            padding: 20px;
+            margin: 20px 0;
+        }
+        .summary-grid {
+            display: table;
+            width: 100%;
+            margin: 20px 0;
+        }
+        .summary-item {
+            display: table-cell;
+            text-align: center;
+            padding: 10px;
+            border-right: 1px solid #ddd;
+        }
+        .summary-item:last-child {
+            border-right: none;
+        }
+        .metric-value {
+            font-size: 28px;
+            font-weight: bold;
+            color: #00796b;
+        }
+        .metric-label {
+            font-size: 14px;
+            color: #666;
+            margin-top: 5px;
+        }
+        .section-header {
+            background-color: #e0f2f1;
+            padding: 12px;
+            margin: 25px 0 15px 0;
+            border-left: 4px solid #00796b;
+            font-weight: bold;
+            font-size: 18px;
+        }
+        .sub-section-header {
+            background-color: #f5f5f5;
+            padding: 8px;
+            margin: 15px 0 10px 0;
+            border-left: 3px solid #4db6ac;
+            font-weight: bold;
+            font-size: 16px;
+        }
+        table {
+            width: 100%;
+            border-collapse: collapse;
+            margin-top: 10px;
+        }
+        th, td {
+            padding: 8px;
+            text-align: left;
+            border-bottom: 1px solid #ddd;
+        }
+        th {
+            background-color: #f8f9fa;
+            font-weight: bold;
+        }
+        .epe-row {
+            background-color: #e8f5e9;
+        }
+        .foreign-row {
+            background-color: #e3f2fd;
+        }
+        .location-tag {
+            background-color: #4db6ac;
+            color: white;
+            padding: 2px 8px;
+            border-radius: 3px;
+            font-size: 12px;
+        }
+        .country-tag {
+            background-color: #2196f3;
+            color: white;
+            padding: 2px 8px;
+            border-radius: 3px;
+            font-size: 12px;
+        }
+        .week-summary {
+            background-color: #f8f9fa;
+            padding: 10px;
+            margin: 10px 0;
+            border-radius: 5px;
+        }
+        .footer {
+            margin-top: 30px;
+            padding: 20px;
+            background-color: #f8f9fa;
+            text-align: center;
+            font-size: 12px;
+            color: #666;
+        }
+        .info-box {
+            background-color: #fff3cd;
+            border: 1px solid #ffeeba;
+            border-radius: 5px;
+            padding: 15px;
+            margin: 20px 0;
+        }
+    </style>
+</head>
+"""
+_CUSTOMS_HTML_HEAD = _minify_style(_CUSTOMS_HTML_HEAD)
+
+_CUSTOMS_HTML_FOOTER = """
+    <div class="info-box">
+        <h4>📋 Customs Documentation Requirements:</h4>
+        <p><strong>For EPE (Xuất khẩu tại chỗ):</strong></p>
+        <ul>
+            <li>Tờ khai xuất khẩu tại chỗ</li>
+            <li>C/O Form D nội địa</li>
+            <li>Hóa đơn VAT</li>
+            <li>Phiếu xuất kho</li>
+        </ul>
+        <p><strong>For Foreign Export:</strong></p>
+        <ul>
+            <li>Export Declaration (Tờ khai xuất khẩu)</li>
+            <li>Certificate of Origin (based on destination country)</li>
+            <li>Commercial Invoice</li>
+            <li>Packing List</li>
+            <li>Bill of Lading / Airway Bill</li>
+        </ul>
+    </div>
+
+    <div class="footer">
+        <p>This is an automated customs clearance schedule from Outbound Logistics System</p>
+        <p>For questions, please contact: <a href="mailto:outbound@prostech.vn">outbound@prostech.vn</a></p>
+        <p>Phone: +84 33 476273</p>
+    </div>
+</div>
+</body>
+</html>
+"""
+
+
+class _SMTPSession:
+    """One SMTP connection, opened on first send and reopened if it drops"""
+    
+    def __init__(self, open_smtp):
+        self._open_smtp = open_smtp
+        self.server = None
+    
+    def send(self, send_message, msg, recipients):
+        if self.server is None:
+            self.server = self._open_smtp()
+        try:
+            send_message(self.server, msg, recipients)
+        except smtplib.SMTPServerDisconnected:
+            # Idle timeout or server-side close: reconnect once and resend
+            logger.info("SMTP session dropped — reconnecting")
+            self.close()
+            self.server = self._open_smtp()
+            send_message(self.server, msg, recipients)
+    
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+            self.server = None
+
 
 class EmailSender:
     """Handle email notifications for delivery schedules"""
@@ -22,32 +718,137 @@ class EmailSender:
     def __init__(self, smtp_host=None, smtp_port=None):
         # Use config V3 (OUTBOUND_EMAIL_CONFIG has sender, password, host, port)
         self.smtp_host = smtp_host or OUTBOUND_EMAIL_CONFIG.get("host", "smtp.gmail.com")
-        self.smtp_port = smtp_port or OUTBOUND_EMAIL_CONFIG.get("port", 587)
+        self.smtp_port = int(smtp_port or OUTBOUND_EMAIL_CONFIG.get("port", 587))
         self.sender_email = OUTBOUND_EMAIL_CONFIG.get("sender") or os.getenv("EMAIL_SENDER", "outbound@prostech.vn")
         self.sender_password = OUTBOUND_EMAIL_CONFIG.get("password") or os.getenv("EMAIL_PASSWORD", "")
         
+        # Stateless — one instance serves every ICS attachment
+        self.calendar_gen = CalendarEventGenerator()
+        
+        # Persistent session while used as a context manager (see __enter__)
+        self._in_session = False
+        self._session = _SMTPSession(self._open_smtp)
+        # Schedule ICS bodies built during the session, by data fingerprint
+        self._ics_cache = {}
+        
         # Log configuration
         logger.info(f"Email sender initialized with: {self.sender_email} via {self.smtp_host}:{self.smtp_port}")
     
+    def _open_smtp(self):
+        """Open an authenticated SMTP session (use as a context manager)
+
+        SMTP_PORT=465 connects with implicit TLS (SMTP_SSL), saving the
+        EHLO/STARTTLS/EHLO round-trip; any other port upgrades via STARTTLS.
+        """
+        if self.smtp_port == SMTP_SSL_PORT:
+            server = smtplib.SMTP_SSL(self.smtp_host, self.smtp_port)
+        else:
+            server = smtplib.SMTP(self.smtp_host, self.smtp_port)
+        try:
+            if self.smtp_port != SMTP_SSL_PORT:
+                server.starttls()
+            server.login(self.sender_email, self.sender_password)
+        except Exception:
+            server.close()
+            raise
+        return server
+    
+    def __enter__(self):
+        """Reuse one SMTP session for every send until the block exits
+
+            with email_sender:
+                for ...:
+                    email_sender.send_delivery_schedule_email(...)
+
+        The session is opened by the first send, so a block that sends
+        nothing never connects.
+        """
+        self._in_session = True
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self._in_session = False
+        self._close_session()
+        self._ics_cache.clear()
+        return False
+    
+    def _close_session(self):
+        self._session.close()
+    
+    def _schedule_ics(self, recipient_name, delivery_df):
+        """ICS body for a delivery schedule, shared within a session
+
+        create_ics_content does not put the recipient name in the calendar,
+        so when the same schedule goes to several people in one run (custom
+        recipients, CC chains) it is built once. Outside a session, and
+        across runs, it is always rebuilt so event stamps stay current.
+        """
+        if not self._in_session:
+            return self.calendar_gen.create_ics_content(recipient_name, delivery_df, self.sender_email)
+        try:
+            key = _frame_fingerprint(delivery_df)
+        except (TypeError, ValueError):
+            return self.calendar_gen.create_ics_content(recipient_name, delivery_df, self.sender_email)
+        if key not in self._ics_cache:
+            self._ics_cache[key] = self.calendar_gen.create_ics_content(recipient_name, delivery_df, self.sender_email)
+        return self._ics_cache[key]
+    
+    def _deliver(self, msg, recipients, server=None):
+        """Send msg on `server`, the persistent session, or a one-off session
+
+        `server` is either an open SMTP connection or an _SMTPSession; the
+        latter (like the persistent session) reconnects if it was dropped.
+        """
+        if isinstance(server, _SMTPSession):
+            server.send(self._send_message, msg, recipients)
+        elif server is not None:
+            self._send_message(server, msg, recipients)
+        elif self._in_session:
+            self._session.send(self._send_message, msg, recipients)
+        else:
+            with self._open_smtp() as server:
+                self._send_message(server, msg, recipients)
+    
+    def _send_message(self, server, msg, recipients):
+        """Send msg, declaring BODY=8BITMIME when the server supports it
+
+        Without the extension, 8bit parts are re-encoded as base64 first.
+        """
+        if server.has_extn('8bitmime'):
+            mail_options = ('BODY=8BITMIME',)
+        else:
+            mail_options = ()
+            for part in msg.walk():
+                if part.get('Content-Transfer-Encoding') == '8bit':
+                    del part['Content-Transfer-Encoding']
+                    encoders.encode_base64(part)
+        server.send_message(msg, from_addr=self.sender_email, to_addrs=recipients,
+                            mail_options=mail_options)
+    
+    @_memoize_html
     def create_overdue_alerts_html(self, delivery_df, sales_name, contact_name=None):
         """Create HTML content for overdue alerts email"""
         
-        # Ensure delivery_date is datetime
-        delivery_df['delivery_date'] = pd.to_datetime(delivery_df['delivery_date'])
+        # Ensure delivery_date is datetime — on a shallow copy, so the
+        # caller's frame is left untouched
+        delivery_df = _with_parsed_dates(delivery_df)
         
-        # Separate overdue and due today
-        overdue_df = delivery_df[delivery_df['delivery_timeline_status'] == 'Overdue'].copy()
-        due_today_df = delivery_df[delivery_df['delivery_timeline_status'] == 'Due Today'].copy()
+        # Separate overdue and due today with plain boolean masks (NA-safe
+        # for Arrow / categorical columns); the slices are only read, so no copies
+        timeline_status = delivery_df['delivery_timeline_status']
+        overdue_df = delivery_df[timeline_status.eq('Overdue').fillna(False).to_numpy(dtype=bool)]
+        due_today_df = delivery_df[timeline_status.eq('Due Today').fillna(False).to_numpy(dtype=bool)]
         
         # Calculate summary statistics
-        total_overdue = overdue_df['delivery_id'].nunique() if not overdue_df.empty else 0
-        total_due_today = due_today_df['delivery_id'].nunique() if not due_today_df.empty else 0
+        total_overdue = _count_ids(overdue_df['delivery_id'])
+        total_due_today = _count_ids(due_today_df['delivery_id'])
         max_days_overdue = overdue_df['days_overdue'].max() if not overdue_df.empty and 'days_overdue' in overdue_df.columns else 0
         
         # Out of stock products
         out_of_stock_products = 0
         if 'product_fulfillment_status' in delivery_df.columns and 'product_id' in delivery_df.columns:
-            out_of_stock_products = delivery_df[delivery_df['product_fulfillment_status'] == 'Out of Stock']['product_id'].nunique()
+            oos_mask = delivery_df['product_fulfillment_status'].eq('Out of Stock').fillna(False).to_numpy(dtype=bool)
+            out_of_stock_products = _count_ids(delivery_df['product_id'][oos_mask])
         
         # Determine greeting
         if contact_name and contact_name != 'Unknown Contact':
@@ -55,114 +856,8 @@ class EmailSender:
         else:
             greeting = f"Dear {sales_name},"
         
-        # Start HTML
-        html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <style>
-                body {{
-                    font-family: Arial, sans-serif;
-                    line-height: 1.6;
-                    color: #333;
-                }}
-                .header {{
-                    background-color: #d32f2f;
-                    color: white;
-                    padding: 20px;
-                    text-align: center;
-                }}
-                .content {{
-                    padding: 20px;
-                }}
-                .alert-box {{
-                    background-color: #ffebee;
-                    border: 2px solid #ef5350;
-                    border-radius: 5px;
-                    padding: 15px;
-                    margin: 20px 0;
-                }}
-                .summary-grid {{
-                    display: table;
-                    width: 100%;
-                    margin: 20px 0;
-                }}
-                .summary-item {{
-                    display: table-cell;
-                    text-align: center;
-                    padding: 10px;
-                }}
-                .metric-value {{
-                    font-size: 36px;
-                    font-weight: bold;
-                    color: #d32f2f;
-                }}
-                .metric-label {{
-                    font-size: 14px;
-                    color: #666;
-                    margin-top: 5px;
-                }}
-                .section-header {{
-                    background-color: #f5f5f5;
-                    padding: 10px;
-                    margin: 20px 0 10px 0;
-                    border-left: 4px solid #d32f2f;
-                    font-weight: bold;
-                    font-size: 18px;
-                }}
-                table {{
-                    width: 100%;
-                    border-collapse: collapse;
-                    margin-top: 10px;
-                }}
-                th, td {{
-                    padding: 8px;
-                    text-align: left;
-                    border-bottom: 1px solid #ddd;
-                }}
-                th {{
-                    background-color: #f8f9fa;
-                    font-weight: bold;
-                }}
-                .overdue-row {{
-                    background-color: #ffcccb;
-                }}
-                .due-today-row {{
-                    background-color: #ffe4b5;
-                }}
-                .out-of-stock {{
-                    color: #d32f2f;
-                    font-weight: bold;
-                }}
-                .days-overdue {{
-                    color: #d32f2f;
-                    font-weight: bold;
-                    font-size: 16px;
-                }}
-                .action-box {{
-                    background-color: #e3f2fd;
-                    border: 1px solid #2196f3;
-                    border-radius: 5px;
-                    padding: 15px;
-                    margin: 20px 0;
-                }}
-                .footer {{
-                    margin-top: 30px;
-                    padding: 20px;
-                    background-color: #f8f9fa;
-                    text-align: center;
-                    font-size: 12px;
-                    color: #666;
-                }}
-            </style>
-        </head>
-        <body>
-            <div class="header">
-                <h1>🚨 URGENT DELIVERY ALERT</h1>
-                <p>Immediate Action Required</p>
-            </div>
-            
-            <div class="content">
+        # Start HTML — static head first, then the per-recipient body
+        parts = [_OVERDUE_HTML_HEAD, f"""
                 <p>{greeting}</p>
                 
                 <div class="alert-box">
@@ -188,141 +883,97 @@ class EmailSender:
                         <div class="metric-label">Out of Stock Products</div>
                     </div>
                 </div>
-        """
+        """]
         
         # Overdue Section
         if not overdue_df.empty:
-            html += """
-                <div class="section-header">🔴 OVERDUE DELIVERIES</div>
-                <p>These deliveries are past their expected delivery date and need immediate attention:</p>
-                <table>
-                    <tr>
-                        <th width="80">Days Overdue</th>
-                        <th width="100">Delivery Date</th>
-                        <th width="150">Customer</th>
-                        <th width="150">Ship To</th>
-                        <th width="80">PT Code</th>
-                        <th width="120">Product</th>
-                        <th width="80">Quantity</th>
-                        <th width="100">Fulfillment</th>
-                        <th width="120">DN Number</th>
-                    </tr>
-            """
+            parts.append(_OVERDUE_TABLE_HEAD)
             
             # Group and sort overdue deliveries
             overdue_display = overdue_df.sort_values(['days_overdue', 'delivery_date'], ascending=[False, True])
             
-            for _, row in overdue_display.iterrows():
-                days_overdue = int(row['days_overdue']) if pd.notna(row['days_overdue']) else 0
-                fulfillment_status = row.get('product_fulfillment_status', row.get('fulfillment_status', 'Unknown'))
-                fulfillment_class = 'out-of-stock' if fulfillment_status == 'Out of Stock' else ''
-                
-                html += f"""
+            parts.extend(
+                f"""
                     <tr class="overdue-row">
-                        <td class="days-overdue">{days_overdue} days</td>
-                        <td>{row['delivery_date'].strftime('%Y-%m-%d')}</td>
+                        <td class="days-overdue">{row['days_overdue']} days</td>
+                        <td>{row['delivery_date']}</td>
                         <td>{row['customer']}</td>
                         <td>{row['recipient_company']}</td>
                         <td>{row['pt_code']}</td>
                         <td>{row['product_pn']}</td>
-                        <td>{row['remaining_quantity_to_deliver']:,.0f}</td>
-                        <td class="{fulfillment_class}">{fulfillment_status}</td>
+                        <td>{row['remaining_quantity_to_deliver']}</td>
+                        <td class="{row['fulfillment_class']}">{row['fulfillment']}</td>
                         <td>{row['dn_number']}</td>
                     </tr>
                 """
-            
-            html += "</table>"
+                for row in _alert_rows(overdue_display)
+            )
+            parts.append("</table>")
         
         # Due Today Section
         if not due_today_df.empty:
-            html += """
-                <div class="section-header">🟡 DUE TODAY</div>
-                <p>These deliveries are scheduled for today and should be prioritized:</p>
-                <table>
-                    <tr>
-                        <th width="100">Delivery Date</th>
-                        <th width="150">Customer</th>
-                        <th width="150">Ship To</th>
-                        <th width="80">PT Code</th>
-                        <th width="120">Product</th>
-                        <th width="80">Quantity</th>
-                        <th width="100">Fulfillment</th>
-                        <th width="120">DN Number</th>
-                    </tr>
-            """
+            parts.append(_DUE_TODAY_TABLE_HEAD)
             
             # Sort by fulfillment status (out of stock first)
             due_today_display = due_today_df.sort_values(['product_fulfillment_status', 'customer'])
             
-            for _, row in due_today_display.iterrows():
-                fulfillment_status = row.get('product_fulfillment_status', row.get('fulfillment_status', 'Unknown'))
-                fulfillment_class = 'out-of-stock' if fulfillment_status == 'Out of Stock' else ''
-                
-                html += f"""
+            parts.extend(
+                f"""
                     <tr class="due-today-row">
-                        <td>{row['delivery_date'].strftime('%Y-%m-%d')}</td>
+                        <td>{row['delivery_date']}</td>
                         <td>{row['customer']}</td>
                         <td>{row['recipient_company']}</td>
                         <td>{row['pt_code']}</td>
                         <td>{row['product_pn']}</td>
-                        <td>{row['remaining_quantity_to_deliver']:,.0f}</td>
-                        <td class="{fulfillment_class}">{fulfillment_status}</td>
+                        <td>{row['remaining_quantity_to_deliver']}</td>
+                        <td class="{row['fulfillment_class']}">{row['fulfillment']}</td>
                         <td>{row['dn_number']}</td>
                     </tr>
                 """
-            
-            html += "</table>"
+                for row in _alert_rows(due_today_display)
+            )
+            parts.append("</table>")
         
         # Action Items
-        html += """
-            <div class="action-box">
-                <h3>📋 Required Actions:</h3>
-                <ol>
-                    <li><strong>Contact Customers:</strong> Inform customers about delivery delays and provide updated ETAs</li>
-                    <li><strong>Coordinate with Warehouse:</strong> Check inventory availability for out-of-stock items</li>
-                    <li><strong>Update Delivery Status:</strong> Ensure all delivery statuses are current in the system</li>
-                    <li><strong>Escalate if Needed:</strong> For deliveries overdue by 5+ days, escalate to management</li>
-                </ol>
-                
-                <p><strong>Logistics Team Contact:</strong><br>
-                📧 Email: outbound@prostech.vn<br>
-                📞 Phone: +84 33 476273</p>
-            </div>
-            
-            <div class="footer">
-                <p>This is an automated urgent alert from Outbound Logistics System</p>
-                <p>Please take immediate action on the items listed above</p>
-                <p>For questions, contact: <a href="mailto:outbound@prostech.vn">outbound@prostech.vn</a></p>
-            </div>
-        </div>
-        </body>
-        </html>
-        """
+        parts.append(_OVERDUE_HTML_FOOTER)
         
-        return html
+        return ''.join(parts)
     
+    @_memoize_html
     def create_delivery_schedule_html(self, delivery_df, recipient_name, weeks_ahead=4, contact_name=None):
         """Create HTML content for delivery schedule email with DN Number and Province"""
         
-        # Ensure delivery_date is datetime
-        delivery_df['delivery_date'] = pd.to_datetime(delivery_df['delivery_date'])
-        
-        # Calculate week information
-        delivery_df['week_start'] = delivery_df['delivery_date'] - pd.to_timedelta(delivery_df['delivery_date'].dt.dayofweek, unit='D')
-        delivery_df['week_end'] = delivery_df['week_start'] + timedelta(days=6)
-        delivery_df['week_key'] = delivery_df['week_start'].dt.strftime('%Y-%m-%d')
-        delivery_df['week'] = delivery_df['delivery_date'].dt.isocalendar().week
-        delivery_df['year'] = delivery_df['delivery_date'].dt.year
-        
-        # Calculate summary statistics
-        out_of_stock_products = 0
-        avg_fulfill_rate = 100.0
+        # Ensure delivery_date is datetime — on a shallow copy, so the
+        # caller's frame is left untouched
+        delivery_df = _with_parsed_dates(delivery_df)
+        
+        # Monday–Sunday weeks; each period carries its own start/end dates
+        delivery_weeks = delivery_df['delivery_date'].dt.to_period('W-SUN').rename('week')
+        
+        # One grouping of deliveries serves the summary and every week header;
+        # a delivery's date fixes its week, so weekly counts come from the keys
+        delivery_keys = delivery_df.groupby(
+            ['delivery_date', 'customer', 'recipient_company'], sort=False, observed=True
+        ).size().index
+        week_deliveries = delivery_keys.get_level_values('delivery_date').to_period('W-SUN').value_counts()
+        
+        # Calculate summary statistics once, reused by the template below
+        has_product_id = 'product_id' in delivery_df.columns
+        stats = {
+            'deliveries': len(delivery_keys),
+            'products': (_count_ids(delivery_df['product_id']) if has_product_id
+                         else delivery_df['product_pn'].nunique()),
+            'quantity': delivery_df['remaining_quantity_to_deliver'].sum(),
+            'out_of_stock': 0,
+            'fulfill_rate': 100.0,
+        }
         
-        if 'product_fulfillment_status' in delivery_df.columns and 'product_id' in delivery_df.columns:
-            out_of_stock_products = delivery_df[delivery_df['product_fulfillment_status'] == 'Out of Stock']['product_id'].nunique()
+        if 'product_fulfillment_status' in delivery_df.columns and has_product_id:
+            oos_mask = delivery_df['product_fulfillment_status'].eq('Out of Stock')
+            stats['out_of_stock'] = _count_ids(delivery_df.loc[oos_mask, 'product_id'])
         
-        if 'product_fulfill_rate_percent' in delivery_df.columns and 'product_id' in delivery_df.columns:
-            avg_fulfill_rate = delivery_df.groupby('product_id')['product_fulfill_rate_percent'].first().mean()
+        if 'product_fulfill_rate_percent' in delivery_df.columns and has_product_id:
+            stats['fulfill_rate'] = delivery_df.groupby('product_id', observed=True, sort=False)['product_fulfill_rate_percent'].first().mean()
         
         # Format weeks text
         week_text = f"{weeks_ahead} Week" if weeks_ahead == 1 else f"{weeks_ahead} Weeks"
@@ -333,95 +984,8 @@ class EmailSender:
         else:
             greeting = f"Dear {recipient_name},"
         
-        # Start HTML
-        html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <style>
-                body {{
-                    font-family: Arial, sans-serif;
-                    line-height: 1.6;
-                    color: #333;
-                }}
-                .header {{
-                    background-color: #1f77b4;
-                    color: white;
-                    padding: 20px;
-                    text-align: center;
-                }}
-                .content {{
-                    padding: 20px;
-                }}
-                .week-section {{
-                    margin-bottom: 30px;
-                    border: 1px solid #ddd;
-                    border-radius: 5px;
-                    padding: 15px;
-                }}
-                .week-header {{
-                    background-color: #f0f2f6;
-                    padding: 10px;
-                    margin: -15px -15px 15px -15px;
-                    border-radius: 5px 5px 0 0;
-                    font-weight: bold;
-                }}
-                table {{
-                    width: 100%;
-                    border-collapse: collapse;
-                    margin-top: 10px;
-                }}
-                th, td {{
-                    padding: 8px;
-                    text-align: left;
-                    border-bottom: 1px solid #ddd;
-                }}
-                th {{
-                    background-color: #f8f9fa;
-                    font-weight: bold;
-                }}
-                .urgent {{
-                    color: #d32f2f;
-                    font-weight: bold;
-                }}
-                .overdue {{
-                    background-color: #ffcccb;
-                    font-weight: bold;
-                }}
-                .warning {{
-                    background-color: #fff3cd;
-                    padding: 10px;
-                    border-radius: 5px;
-                    margin: 10px 0;
-                }}
-                .footer {{
-                    margin-top: 30px;
-                    padding: 20px;
-                    background-color: #f8f9fa;
-                    text-align: center;
-                    font-size: 12px;
-                    color: #666;
-                }}
-                .metric-box {{
-                    display: inline-block;
-                    background-color: #f0f2f6;
-                    padding: 15px;
-                    margin: 10px;
-                    border-radius: 5px;
-                    text-align: center;
-                }}
-                .metric-value {{
-                    font-size: 24px;
-                    font-weight: bold;
-                    color: #1f77b4;
-                }}
-                .metric-label {{
-                    font-size: 12px;
-                    color: #666;
-                    margin-top: 5px;
-                }}
-            </style>
-        </head>
+        # Start HTML — static head first, then the per-recipient body
+        parts = [_SCHEDULE_HTML_HEAD, f"""
         <body>
             <div class="header">
                 <h1>📦 Delivery Schedule Notification</h1>
@@ -437,57 +1001,121 @@ class EmailSender:
                     <h3>📊 Summary</h3>
                     <div style="text-align: center;">
                         <div class="metric-box">
-                            <div class="metric-value">{delivery_df.groupby(['delivery_date', 'customer', 'recipient_company']).ngroups}</div>
+                            <div class="metric-value">{stats['deliveries']}</div>
                             <div class="metric-label">Total Deliveries</div>
                         </div>
                         <div class="metric-box">
-                            <div class="metric-value">{delivery_df['product_id'].nunique() if 'product_id' in delivery_df.columns else delivery_df['product_pn'].nunique()}</div>
+                            <div class="metric-value">{stats['products']}</div>
                             <div class="metric-label">Product Types</div>
                         </div>
                         <div class="metric-box">
-                            <div class="metric-value">{delivery_df['remaining_quantity_to_deliver'].sum():,.0f}</div>
+                            <div class="metric-value">{stats['quantity']:,.0f}</div>
                             <div class="metric-label">Total Quantity</div>
                         </div>
                         <div class="metric-box">
-                            <div class="metric-value">{avg_fulfill_rate:.1f}%</div>
+                            <div class="metric-value">{stats['fulfill_rate']:.1f}%</div>
                             <div class="metric-label">Avg Fulfillment Rate</div>
                         </div>
                     </div>
                 </div>
-        """
+        """]
         
         # Add alerts if any out of stock products
-        if out_of_stock_products > 0:
-            html += f"""
+        if stats['out_of_stock'] > 0:
+            parts.append(f"""
                 <div class="warning">
                     <strong>⚠️ Attention Required:</strong><br>
-                    • {out_of_stock_products} products are out of stock<br>
+                    • {stats['out_of_stock']} products are out of stock<br>
                     Please coordinate with the logistics team to resolve these issues.
                 </div>
-            """
+            """)
         
-        # Group by week and create sections
-        for week_key, week_df in delivery_df.groupby('week_key', sort=True):
-            week_start = week_df['week_start'].iloc[0]
-            week_end = week_df['week_end'].iloc[0]
-            week_number = week_df['week'].iloc[0]
-            
-            # Calculate totals for this week
-            week_unique_deliveries = week_df.groupby(['delivery_date', 'customer', 'recipient_company']).ngroups
-            week_unique_products = week_df['product_id'].nunique()
-            week_total_qty = week_df['remaining_quantity_to_deliver'].sum()
+        # Table rows for every week from one aggregation, sorted by week,
+        # date and DN so each week is a contiguous run of rows
+        if has_product_id:
+            group_cols = ['delivery_date', 'dn_number', 'customer', 'recipient_company', 
+                        'recipient_state_province', 'product_id', 'pt_code', 'product_pn']
+        else:
+            group_cols = ['delivery_date', 'dn_number', 'customer', 'recipient_company', 
+                        'recipient_state_province', 'pt_code', 'product_pn']
+        
+        agg_dict = {
+            'remaining_quantity_to_deliver': 'sum'
+        }
+        
+        if 'product_fulfillment_status' in delivery_df.columns:
+            agg_dict['product_fulfillment_status'] = 'first'
+        
+        # Display strings from preformat_schedule_columns ride along
+        preformatted = all(col in delivery_df.columns for col in PREFORMATTED_COLUMNS)
+        if preformatted:
+            agg_dict.update(dict.fromkeys(PREFORMATTED_COLUMNS, 'first'))
+        
+        display_all = (
+            delivery_df.groupby([delivery_weeks.rename('_week'), *group_cols], observed=True)
+            .agg(agg_dict)
+            .reset_index()
+            .sort_values(['_week', 'delivery_date', 'dn_number'], ignore_index=True)
+        )
+        
+        if 'product_fulfillment_status' in display_all.columns:
+            product_status = display_all['product_fulfillment_status'].astype(object).astype(str)
+        else:
+            product_status = pd.Series('Unknown', index=display_all.index)
+        status_class = np.where(product_status.isin(['Out of Stock', 'Can Fulfill Partial']), 'urgent', '')
+        
+        # Free-text values are HTML-escaped once per column
+        if preformatted:
+            text = {target: display_all[target] for target in PREFORMATTED_COLUMNS}
+        else:
+            text = preformat_schedule_columns(
+                display_all[list(PREFORMATTED_COLUMNS.values())]
+            )
+        columns = [text[target].to_numpy() for target in PREFORMATTED_COLUMNS]
+        columns += [
+            display_all['remaining_quantity_to_deliver'].to_numpy(),
+            status_class,
+            product_status.map(escape).to_numpy(),
+        ]
+        rows_html = [
+            f'<tr><td>{date}</td><td>{dn}</td><td>{customer}</td><td>{ship_to}</td>'
+            f'<td>{loc}</td><td>{pt}</td><td>{product}</td><td>{qty:,.0f}</td>'
+            f'<td class="{css}">{status}</td></tr>'
+            for date, dn, customer, ship_to, loc, pt, product, qty, css, status in zip(*columns)
+        ]
+        week_rows = display_all.groupby('_week', observed=True, sort=False).indices
+        
+        # Week header totals in one grouping
+        week_totals = delivery_df.groupby(delivery_weeks, observed=True, sort=True).agg(
+            products=('product_id' if has_product_id else 'product_pn', 'nunique'),
+            quantity=('remaining_quantity_to_deliver', 'sum'),
+        )
+        
+        # Week numbers and header dates formatted once for all weeks
+        week_starts = week_totals.index.start_time
+        week_labels = zip(
+            week_starts.isocalendar()['week'].to_numpy(),
+            week_starts.strftime('%b %d'),
+            week_totals.index.end_time.strftime('%b %d, %Y'),
+        )
+        
+        # One section per week
+        for (week, week_unique_products, week_total_qty), (week_number, start_label, end_label) in zip(
+            week_totals.itertuples(name=None), week_labels
+        ):
+            week_unique_deliveries = week_deliveries.get(week, 0)
             
-            html += f"""
+            parts.append(f"""
                 <div class="week-section">
                     <div class="week-header">
-                        Week {week_number} ({week_start.strftime('%b %d')} - {week_end.strftime('%b %d, %Y')})
+                        Week {week_number} ({start_label} - {end_label})
                         <span style="float: right; font-size: 14px;">
                             {week_unique_deliveries} deliveries | {week_unique_products} products | {week_total_qty:,.0f} units
                         </span>
                     </div>
-            """
+            """)
             
-            html += """
+            parts.append("""
                     <table>
                         <tr>
                             <th style="width: 80px;">Date</th>
@@ -500,90 +1128,43 @@ class EmailSender:
                             <th style="width: 60px;">Qty</th>
                             <th style="width: 90px;">Fulfillment</th>
                         </tr>
-            """
-            
-            # Group by delivery for display
-            if 'product_id' in week_df.columns:
-                group_cols = ['delivery_date', 'dn_number', 'customer', 'recipient_company', 
-                            'recipient_state_province', 'product_id', 'pt_code', 'product_pn']
-            else:
-                group_cols = ['delivery_date', 'dn_number', 'customer', 'recipient_company', 
-                            'recipient_state_province', 'pt_code', 'product_pn']
+            """)
             
-            # Create aggregation
-            agg_dict = {
-                'remaining_quantity_to_deliver': 'sum'
-            }
-            
-            if 'product_fulfillment_status' in week_df.columns:
-                agg_dict['product_fulfillment_status'] = 'first'
-            
-            display_group = week_df.groupby(group_cols, as_index=False).agg(agg_dict)
-            
-            # Sort by date and DN number
-            display_group = display_group.sort_values(['delivery_date', 'dn_number'])
+            positions = week_rows.get(week)
+            if positions is not None:
+                parts.extend(rows_html[positions[0]:positions[-1] + 1])
             
-            # Add rows to table
-            for _, row in display_group.iterrows():
-                # Product fulfillment status
-                product_status = row.get('product_fulfillment_status', 'Unknown')
-                status_class = 'urgent' if product_status in ['Out of Stock', 'Can Fulfill Partial'] else ''
-                
-                # Format province name
-                province = row['recipient_state_province'] if pd.notna(row['recipient_state_province']) else ''
-                
-                html += f"""
-                        <tr>
-                            <td>{row['delivery_date'].strftime('%b %d')}</td>
-                            <td>{row['dn_number']}</td>
-                            <td>{row['customer']}</td>
-                            <td>{row['recipient_company']}</td>
-                            <td>{province}</td>
-                            <td>{row['pt_code']}</td>
-                            <td>{row['product_pn']}</td>
-                            <td>{row['remaining_quantity_to_deliver']:,.0f}</td>
-                            <td class="{status_class}">{product_status}</td>
-                        </tr>
-                """
-            
-            html += """
+            parts.append("""
                     </table>
                 </div>
-            """
-        
-        # Add legend
-        html += """
-            <div style="margin-top: 20px; padding: 15px; background-color: #f8f9fa; border-radius: 5px;">
-                <h4>Fulfillment Status:</h4>
-                <p>• <strong>Can Fulfill All:</strong> Sufficient inventory for all deliveries<br>
-                • <strong>Can Fulfill Partial:</strong> Limited inventory available<br>
-                • <strong>Out of Stock:</strong> No inventory available</p>
-            </div>
-        """
+            """)
         
-        # Add footer
-        html += """
-                <div class="footer">
-                    <p>This is an automated email from Outbound Logistics System</p>
-                    <p>For questions, please contact: <a href="mailto:outbound@prostech.vn">outbound@prostech.vn</a></p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
+        # Add legend and footer
+        parts.append(_SCHEDULE_HTML_FOOTER)
         
-        return html
+        return '\n'.join(parts)
 
     def send_delivery_schedule_email(self, recipient_email, recipient_name, delivery_df, 
                                 cc_emails=None, notification_type="📅 Delivery Schedule", 
-                                weeks_ahead=4, contact_name=None):
-        """Send delivery schedule email with enhanced content"""
+                                weeks_ahead=4, contact_name=None, server=None):
+        """Send delivery schedule email with enhanced content
+
+        Pass an open connection from _open_smtp(), or an _SMTPSession, as
+        `server` to skip the per-message connect/STARTTLS/login (bulk
+        sends); inside a `with email_sender:` block the instance's own
+        session is reused.
+        """
         try:
             # Check email configuration
             if not self.sender_email or not self.sender_password:
                 logger.error("Email configuration missing. Please set EMAIL_SENDER and EMAIL_PASSWORD.")
                 return False, "Email configuration missing. Please check environment variables."
             
+            # Nothing to report — skip rendering, attachments and SMTP
+            if delivery_df is None or delivery_df.empty:
+                logger.info(f"No deliveries for {recipient_email} — email skipped")
+                return True, NO_DELIVERIES_MESSAGE
+            
             # Remove duplicate columns
             delivery_df = delivery_df.loc[:, ~delivery_df.columns.duplicated()]
             
@@ -592,8 +1173,8 @@ class EmailSender:
             
             # Set subject based on notification type with dynamic weeks
             if notification_type == "🚨 Overdue Alerts":
-                overdue_count = delivery_df[delivery_df['delivery_timeline_status'] == 'Overdue']['delivery_id'].nunique()
-                due_today_count = delivery_df[delivery_df['delivery_timeline_status'] == 'Due Today']['delivery_id'].nunique()
+                overdue_count = _count_ids(delivery_df.loc[delivery_df['delivery_timeline_status'] == 'Overdue', 'delivery_id'])
+                due_today_count = _count_ids(delivery_df.loc[delivery_df['delivery_timeline_status'] == 'Due Today', 'delivery_id'])
                 # Include contact name in urgent subject if available
                 if contact_name and contact_name != 'Unknown Contact':
                     msg['Subject'] = f"🚨 URGENT: {overdue_count} Overdue & {due_today_count} Due Today Deliveries - {recipient_name} (Attn: {contact_name})"
@@ -614,22 +1195,40 @@ class EmailSender:
             if cc_emails:
                 msg['Cc'] = ', '.join(cc_emails)
             
-            # Create HTML content based on notification type
-            if notification_type == "🚨 Overdue Alerts":
-                html_content = self.create_overdue_alerts_html(delivery_df, recipient_name, contact_name)
-            else:
-                html_content = self.create_delivery_schedule_html(delivery_df, recipient_name, weeks_ahead, contact_name)
+            # Parse delivery_date once for all three builders
+            delivery_df = _with_parsed_dates(delivery_df)
+            
+            # HTML, Excel and ICS are independent — build them concurrently.
+            # The HTML / ICS builders assign columns, so each gets its own
+            # shallow copy (create_excel_attachment builds a new frame).
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                if notification_type == "🚨 Overdue Alerts":
+                    html_future = executor.submit(
+                        self.create_overdue_alerts_html,
+                        delivery_df.copy(deep=False), recipient_name, contact_name
+                    )
+                else:
+                    html_future = executor.submit(
+                        self.create_delivery_schedule_html,
+                        delivery_df.copy(deep=False), recipient_name, weeks_ahead, contact_name
+                    )
+                excel_future = executor.submit(self.create_excel_attachment, delivery_df, notification_type)
+                
+                # ICS calendar attachment (only for delivery schedule)
+                ics_future = None
+                if notification_type == "📅 Delivery Schedule":
+                    ics_future = executor.submit(self._schedule_ics, recipient_name, delivery_df.copy(deep=False))
+                
+                html_content = html_future.result()
+                excel_data = excel_future.result()
             
             # Wrap HTML in 'alternative' sub-part, then attach to 'mixed'
             body_part = MIMEMultipart('alternative')
             body_part.attach(MIMEText(html_content, 'html'))
             msg.attach(body_part)
             
-            # Create Excel attachment
-            excel_data = self.create_excel_attachment(delivery_df, notification_type)
-            excel_part = MIMEBase('application', 'vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-            excel_part.set_payload(excel_data.read())
-            encoders.encode_base64(excel_part)
+            # Excel attachment
+            excel_part = _xlsx_part(excel_data)
             
             # Set filename based on notification type and recipient
             if notification_type == "🚨 Overdue Alerts":
@@ -652,16 +1251,13 @@ class EmailSender:
             )
             msg.attach(excel_part)
             
-            # Create ICS calendar attachment (only for delivery schedule)
-            if notification_type == "📅 Delivery Schedule":
+            # ICS calendar attachment (only for delivery schedule)
+            if ics_future is not None:
                 try:
-                    calendar_gen = CalendarEventGenerator()
-                    ics_content = calendar_gen.create_ics_content(recipient_name, delivery_df, self.sender_email)
+                    ics_content = ics_future.result()
                     
                     if ics_content:
-                        ics_part = MIMEBase('text', 'calendar')
-                        ics_part.set_payload(ics_content.encode('utf-8'))
-                        encoders.encode_base64(ics_part)
+                        ics_part = _ics_part(ics_content)
                         
                         # Include contact name in calendar filename if available
                         if contact_name and contact_name != 'Unknown Contact':
@@ -681,15 +1277,11 @@ class EmailSender:
             
             # Send email
             logger.info(f"Attempting to send {notification_type} email to {recipient_email}...")
-            with smtplib.SMTP(self.smtp_host, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.sender_email, self.sender_password)
-                
-                recipients = [recipient_email]
-                if cc_emails:
-                    recipients.extend(cc_emails)
-                
-                server.sendmail(self.sender_email, recipients, msg.as_string())
+            recipients = [recipient_email]
+            if cc_emails:
+                recipients.extend(cc_emails)
+            
+            self._deliver(msg, recipients, server)
             
             logger.info(f"Email sent successfully to {recipient_email}")
             return True, "Email sent successfully"
@@ -702,22 +1294,6 @@ class EmailSender:
         """Create Excel file as attachment with enhanced information"""
         output = io.BytesIO()
         
-        # Create a copy for Excel export - NO AGGREGATION, show all line items
-        excel_df = delivery_df.copy()
-        
-        # Format date columns for Excel
-        date_columns = ['delivery_date', 'created_date', 'delivered_date', 'dispatched_date', 'sto_etd_date', 'oc_date']
-        for col in date_columns:
-            if col in excel_df.columns:
-                excel_df[col] = pd.to_datetime(excel_df[col]).dt.strftime('%Y-%m-%d')
-        
-        # Drop internal calculation columns if they exist
-        columns_to_drop = ['week_start', 'week_end', 'week_key', 'week', 'year', 'total_quantity']
-        excel_df = excel_df.drop(columns=[col for col in columns_to_drop if col in excel_df.columns])
-        
-        # Remove duplicate columns before processing
-        excel_df = excel_df.loc[:, ~excel_df.columns.duplicated()]
-        
         # Select and order important columns for better readability
         important_columns = [
             'delivery_date',
@@ -755,18 +1331,29 @@ class EmailSender:
             'is_epe_company'
         ]
         
-        # Filter to only include columns that exist
-        available_columns = [col for col in important_columns if col in excel_df.columns]
+        # Internal calculation columns never reach the sheet
+        columns_to_drop = {'week_start', 'week_end', 'week_key', 'week', 'year', 'total_quantity',
+                           *PREFORMATTED_COLUMNS}
+        kept_columns = [col for col in dict.fromkeys(delivery_df.columns) if col not in columns_to_drop]
         
-        # Add any remaining columns not in the important list
-        remaining_columns = [col for col in excel_df.columns if col not in available_columns]
+        # Important columns first, then any remaining columns not in the important list
+        available_columns = [col for col in important_columns if col in kept_columns]
+        remaining_columns = [col for col in kept_columns if col not in available_columns]
         final_columns = available_columns + remaining_columns
         
-        # Remove duplicates from final columns list
-        final_columns = list(dict.fromkeys(final_columns))
+        # One projection of the kept columns - NO AGGREGATION, show all line items
+        source_df = delivery_df
+        if delivery_df.columns.has_duplicates:
+            source_df = delivery_df.loc[:, ~delivery_df.columns.duplicated()]
+        excel_df = source_df.reindex(columns=final_columns)
         
-        # Reorder dataframe
-        excel_df = excel_df[final_columns]
+        # Format date columns for Excel
+        date_columns = ['delivery_date', 'created_date', 'delivered_date', 'dispatched_date', 'sto_etd_date', 'oc_date']
+        date_columns = [col for col in date_columns if col in excel_df.columns]
+        if date_columns:
+            excel_df[date_columns] = excel_df[date_columns].apply(
+                lambda s: _as_datetime(s).dt.strftime('%Y-%m-%d')
+            )
         
         # Sort by delivery date and customer for better organization
         sort_columns = ['delivery_date', 'customer', 'dn_number', 'oc_line_id']
@@ -774,87 +1361,74 @@ class EmailSender:
         if sort_columns:
             excel_df = excel_df.sort_values(sort_columns)
         
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+        with pd.ExcelWriter(output, engine='xlsxwriter', engine_kwargs=EXCEL_WRITER_KWARGS) as writer:
             try:
+                workbook = writer.book
+                # Same look as the to_excel header
+                to_excel_header = workbook.add_format({
+                    'bold': True,
+                    'border': 1,
+                    'align': 'center',
+                    'valign': 'top'
+                })
+                
+                urgent_format = workbook.add_format({
+                    'bg_color': '#ffcccb',
+                    'border': 1
+                })
+                
+                # sheet name -> (worksheet, data rows)
+                sheets = {}
+                
+                def write(sheet_name, df):
+                    # Out-of-stock line items are highlighted as they are written
+                    row_formats = None
+                    if 'fulfillment_status' in df.columns:
+                        # NA-safe for Arrow / categorical columns with missing values
+                        oos_mask = df['fulfillment_status'].eq('Out of Stock').fillna(False).to_numpy(dtype=bool)
+                        if oos_mask.any():
+                            row_formats = np.where(oos_mask, urgent_format, None)
+                    sheets[sheet_name] = (
+                        _write_sheet(workbook, sheet_name, df, to_excel_header, row_formats), len(df)
+                    )
+                
                 # For Overdue Alerts, create different sheets
                 if notification_type == "🚨 Overdue Alerts":
                     # Separate overdue and due today
-                    overdue_df = excel_df[excel_df['delivery_timeline_status'] == 'Overdue'].copy()
-                    due_today_df = excel_df[excel_df['delivery_timeline_status'] == 'Due Today'].copy()
+                    overdue_df = excel_df[excel_df['delivery_timeline_status'] == 'Overdue']
+                    due_today_df = excel_df[excel_df['delivery_timeline_status'] == 'Due Today']
                     
                     # Write overdue sheet
                     if not overdue_df.empty:
                         overdue_df = overdue_df.sort_values('days_overdue', ascending=False)
-                        overdue_df.to_excel(writer, sheet_name='Overdue Deliveries', index=False)
+                        write('Overdue Deliveries', overdue_df)
                     
                     # Write due today sheet
                     if not due_today_df.empty:
-                        due_today_df.to_excel(writer, sheet_name='Due Today', index=False)
+                        write('Due Today', due_today_df)
                     
                     # Create summary sheet
                     summary_df = self._create_urgent_summary_sheet(delivery_df)
-                    summary_df.to_excel(writer, sheet_name='Summary', index=False)
+                    write('Summary', summary_df)
                 else:
                     # Regular delivery schedule sheets
-                    excel_df.to_excel(writer, sheet_name='Line Items Detail', index=False)
+                    write('Line Items Detail', excel_df)
                     
                     # Create summary sheet
                     summary_df = self._create_summary_sheet(delivery_df)
-                    summary_df.to_excel(writer, sheet_name='Summary', index=False)
+                    write('Summary', summary_df)
                     
                     # Create product analysis sheet (only if columns exist)
                     if 'product_gap_quantity' in delivery_df.columns:
                         try:
                             product_analysis_df = self._create_product_analysis_sheet(delivery_df)
-                            product_analysis_df.to_excel(writer, sheet_name='Product Analysis', index=False)
+                            write('Product Analysis', product_analysis_df)
                         except Exception as e:
                             logger.warning(f"Could not create Product Analysis sheet: {e}")
                 
-                # Get workbook and apply formatting
-                workbook = writer.book
-                
-                # Define formats
-                header_format = workbook.add_format({
-                    'bold': True,
-                    'bg_color': '#1f77b4' if notification_type == "📅 Delivery Schedule" else '#d32f2f',
-                    'font_color': 'white',
-                    'border': 1,
-                    'text_wrap': True,
-                    'valign': 'vcenter'
-                })
-                
-                date_format = workbook.add_format({
-                    'num_format': 'yyyy-mm-dd',
-                    'border': 1
-                })
-                
-                number_format = workbook.add_format({
-                    'num_format': '#,##0',
-                    'border': 1
-                })
-                
-                percent_format = workbook.add_format({
-                    'num_format': '0.0%',
-                    'border': 1
-                })
-                
-                urgent_format = workbook.add_format({
-                    'bg_color': '#ffcccb',
-                    'border': 1
-                })
-                
-                overdue_format = workbook.add_format({
-                    'bg_color': '#ffcccb',
-                    'font_color': '#d32f2f',
-                    'bold': True,
-                    'border': 1
-                })
-                
                 # Apply formatting to all sheets
-                for sheet_name in writer.sheets:
-                    worksheet = writer.sheets[sheet_name]
-                    
-                    # Set column widths and formatting
+                for sheet_name, (worksheet, last_row) in sheets.items():
+                    # Set column widths and formatting (fixed width, no per-column scan)
                     worksheet.set_column(0, 50, 15)  # Default width
                     
                     # Freeze first row
@@ -862,7 +1436,6 @@ class EmailSender:
                     
                     # Add filters
                     if sheet_name in ['Line Items Detail', 'Overdue Deliveries', 'Due Today']:
-                        last_row = len(excel_df) if sheet_name == 'Line Items Detail' else len(overdue_df) + len(due_today_df)
                         last_col = len(final_columns) - 1
                         worksheet.autofilter(0, 0, last_row, last_col)
                 
@@ -882,7 +1455,7 @@ class EmailSender:
         summary_data = []
         
         # Group by customer and timeline status
-        for (customer, status), group_df in delivery_df_clean.groupby(['customer', 'delivery_timeline_status']):
+        for (customer, status), group_df in delivery_df_clean.groupby(['customer', 'delivery_timeline_status'], observed=True):
             summary_data.append({
                 'Customer': customer,
                 'Status': status,
@@ -904,34 +1477,47 @@ class EmailSender:
     
     def _create_summary_sheet(self, delivery_df):
         """Create summary data for Excel"""
-        # Remove duplicate columns first
-        delivery_df_clean = delivery_df.loc[:, ~delivery_df.columns.duplicated()]
-        
-        # Direct grouping - no need to group twice
-        agg_dict = {
-            'dn_number': lambda x: ', '.join(x.unique()),
-            'product_pn': lambda x: len(x.unique()),
-            'standard_quantity': 'sum',
-            'remaining_quantity_to_deliver': 'sum'
+        columns_present = set(delivery_df.columns)
+        
+        # Single grouping with built-in aggregations — no per-group Python callbacks
+        aggs = {
+            'dn_number': ('dn_number', 'unique'),
+            'product_pn': ('product_pn', 'nunique'),
+            'standard_quantity': ('standard_quantity', 'sum'),
+            'remaining_quantity_to_deliver': ('remaining_quantity_to_deliver', 'sum'),
+            'line_items_count': ('dn_number', 'size'),
         }
         
         # Add conditional aggregations only if columns exist
-        if 'fulfillment_status' in delivery_df_clean.columns:
-            agg_dict['fulfillment_status'] = lambda x: 'Mixed' if x.nunique() > 1 else x.iloc[0]
+        has_status = 'fulfillment_status' in columns_present
+        if has_status:
+            aggs['status_count'] = ('fulfillment_status', 'nunique')
+            aggs['fulfillment_status'] = ('fulfillment_status', 'first')
         
-        if 'delivery_timeline_status' in delivery_df_clean.columns:
-            agg_dict['delivery_timeline_status'] = lambda x: x.iloc[0]
+        if 'delivery_timeline_status' in columns_present:
+            aggs['delivery_timeline_status'] = ('delivery_timeline_status', 'first')
             
-        if 'days_overdue' in delivery_df_clean.columns:
-            agg_dict['days_overdue'] = 'max'
-        
-        summary = delivery_df_clean.groupby(['delivery_date', 'customer', 'recipient_company']).agg(agg_dict).reset_index()
+        if 'days_overdue' in columns_present:
+            aggs['days_overdue'] = ('days_overdue', 'max')
+        
+        # Project to the keys and aggregated columns (first of any duplicate
+        # names) before grouping, instead of carrying the whole frame along
+        group_keys = ['delivery_date', 'customer', 'recipient_company']
+        needed = group_keys + [source for source, _ in aggs.values()]
+        delivery_df_clean = delivery_df.loc[
+            :, delivery_df.columns.isin(needed) & ~delivery_df.columns.duplicated()
+        ]
         
-        # Calculate line items count
-        line_items = delivery_df_clean.groupby(['delivery_date', 'customer', 'recipient_company']).size().reset_index(name='line_items_count')
+        summary = delivery_df_clean.groupby(group_keys, observed=True).agg(**aggs).reset_index()
+        # Arrow-backed reads can hand DATE(etd) over as date/string values
+        summary['delivery_date'] = _as_datetime(summary['delivery_date'])
         
-        # Merge line items count
-        summary = summary.merge(line_items, on=['delivery_date', 'customer', 'recipient_company'])
+        # DN numbers in order of appearance, as one cell
+        summary['dn_number'] = [', '.join(dns) for dns in summary['dn_number']]
+        if has_status:
+            summary['fulfillment_status'] = summary['fulfillment_status'].astype(object).where(
+                summary['status_count'] <= 1, 'Mixed'
+            )
         
         # Build columns list dynamically
         cols = ['delivery_date', 'customer', 'recipient_company', 'dn_number',
@@ -968,7 +1554,9 @@ class EmailSender:
             return pd.DataFrame()  # Return empty if no product_id
         
         # Group by product for analysis
-        product_analysis = delivery_df_clean.groupby(['product_id', 'pt_code', 'product_pn']).agg({
+        product_analysis = delivery_df_clean.groupby(
+            ['product_id', 'pt_code', 'product_pn'], observed=True, sort=False
+        ).agg({
             'delivery_id': 'nunique',
             'remaining_quantity_to_deliver': 'sum',
             'product_total_remaining_demand': 'first',
@@ -998,171 +1586,97 @@ class EmailSender:
         return product_analysis
     
     def send_bulk_delivery_schedules(self, sales_deliveries, progress_callback=None):
-        """Send delivery schedules to multiple sales people"""
-        results = []
-        total = len(sales_deliveries)
+        """Send delivery schedules to multiple sales people
+
+        Sends run on up to BULK_SEND_WORKERS threads; each thread opens one
+        SMTP session (connect + STARTTLS + login) and reuses it for all of
+        its sends, reconnecting once if the server drops it. Results keep the input order; progress_callback is
+        called from the calling thread as sends complete. Recipients with
+        no deliveries are recorded as skipped without opening a session.
+        
+        Slice the frames from a parent passed through
+        preformat_schedule_columns so the table strings are built once for
+        the whole batch rather than once per e-mail.
+        """
+        results = [None] * len(sales_deliveries)
         
-        for idx, (sales_info, delivery_df) in enumerate(sales_deliveries):
-            if progress_callback:
-                progress_callback(idx + 1, total, f"Sending to {sales_info['name']}...")
-            
-            success, message = self.send_delivery_schedule_email(
-                sales_info['email'],
-                sales_info['name'],
-                delivery_df
-            )
-            
-            results.append({
+        def record(idx, success, message):
+            sales_info, delivery_df = sales_deliveries[idx]
+            results[idx] = {
                 'sales': sales_info['name'],
                 'email': sales_info['email'],
                 'success': success,
                 'message': message,
                 'deliveries': len(delivery_df)
-            })
+            }
+        
+        # Recipients without deliveries never reach the pool
+        pending = []
+        for idx, (_, delivery_df) in enumerate(sales_deliveries):
+            if delivery_df is None or delivery_df.empty:
+                record(idx, True, NO_DELIVERIES_MESSAGE)
+            else:
+                pending.append(idx)
+        total = len(pending)
+        if total == 0:
+            return results
+        
+        local = threading.local()
+        sessions = []
+        sessions_lock = threading.Lock()
+        
+        def send_one(sales_info, delivery_df):
+            # Opened by the thread's first send (errors are reported per send)
+            session = getattr(local, 'session', None)
+            if session is None:
+                session = local.session = _SMTPSession(self._open_smtp)
+                with sessions_lock:
+                    sessions.append(session)
+            return self.send_delivery_schedule_email(
+                sales_info['email'],
+                sales_info['name'],
+                delivery_df,
+                server=session
+            )
+        
+        try:
+            with ThreadPoolExecutor(max_workers=min(BULK_SEND_WORKERS, total)) as executor:
+                futures = {
+                    executor.submit(send_one, *sales_deliveries[idx]): idx
+                    for idx in pending
+                }
+                for done, future in enumerate(as_completed(futures), start=1):
+                    idx = futures[future]
+                    if progress_callback:
+                        progress_callback(done, total, f"Sent to {sales_deliveries[idx][0]['name']}")
+                    record(idx, *future.result())
+        finally:
+            for session in sessions:
+                session.close()
         
         return results
     
     def create_customs_clearance_html(self, delivery_df, weeks_ahead=4):
         """Create HTML content for customs clearance email"""
         
-        # Ensure delivery_date is datetime
-        delivery_df['delivery_date'] = pd.to_datetime(delivery_df['delivery_date'])
+        # Ensure delivery_date is datetime — on a shallow copy, so the
+        # caller's frame is left untouched
+        delivery_df = _with_parsed_dates(delivery_df)
         
         # Separate EPE and Foreign deliveries
-        epe_df = delivery_df[delivery_df['customs_type'] == 'EPE'].copy()
-        foreign_df = delivery_df[delivery_df['customs_type'] == 'Foreign'].copy()
+        epe_df = delivery_df[delivery_df['customs_type'] == 'EPE']
+        foreign_df = delivery_df[delivery_df['customs_type'] == 'Foreign']
         
         # Calculate summary statistics
-        total_epe_deliveries = epe_df['delivery_id'].nunique() if not epe_df.empty else 0
-        total_foreign_deliveries = foreign_df['delivery_id'].nunique() if not foreign_df.empty else 0
+        total_epe_deliveries = _count_ids(epe_df['delivery_id'])
+        total_foreign_deliveries = _count_ids(foreign_df['delivery_id'])
         total_countries = foreign_df['customer_country_name'].nunique() if not foreign_df.empty else 0
         total_epe_locations = epe_df['recipient_state_province'].nunique() if not epe_df.empty else 0
         
         total_quantity = delivery_df['remaining_quantity_to_deliver'].sum()
         
-        # Start HTML
-        html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <style>
-                body {{
-                    font-family: Arial, sans-serif;
-                    line-height: 1.6;
-                    color: #333;
-                }}
-                .header {{
-                    background-color: #00796b;
-                    color: white;
-                    padding: 20px;
-                    text-align: center;
-                }}
-                .content {{
-                    padding: 20px;
-                }}
-                .summary-section {{
-                    background-color: #f5f5f5;
-                    border-radius: 5px;
-                    padding: 20px;
-                    margin: 20px 0;
-                }}
-                .summary-grid {{
-                    display: table;
-                    width: 100%;
-                    margin: 20px 0;
-                }}
-                .summary-item {{
-                    display: table-cell;
-                    text-align: center;
-                    padding: 10px;
-                    border-right: 1px solid #ddd;
-                }}
-                .summary-item:last-child {{
-                    border-right: none;
-                }}
-                .metric-value {{
-                    font-size: 28px;
-                    font-weight: bold;
-                    color: #00796b;
-                }}
-                .metric-label {{
-                    font-size: 14px;
-                    color: #666;
-                    margin-top: 5px;
-                }}
-                .section-header {{
-                    background-color: #e0f2f1;
-                    padding: 12px;
-                    margin: 25px 0 15px 0;
-                    border-left: 4px solid #00796b;
-                    font-weight: bold;
-                    font-size: 18px;
-                }}
-                .sub-section-header {{
-                    background-color: #f5f5f5;
-                    padding: 8px;
-                    margin: 15px 0 10px 0;
-                    border-left: 3px solid #4db6ac;
-                    font-weight: bold;
-                    font-size: 16px;
-                }}
-                table {{
-                    width: 100%;
-                    border-collapse: collapse;
-                    margin-top: 10px;
-                }}
-                th, td {{
-                    padding: 8px;
-                    text-align: left;
-                    border-bottom: 1px solid #ddd;
-                }}
-                th {{
-                    background-color: #f8f9fa;
-                    font-weight: bold;
-                }}
-                .epe-row {{
-                    background-color: #e8f5e9;
-                }}
-                .foreign-row {{
-                    background-color: #e3f2fd;
-                }}
-                .location-tag {{
-                    background-color: #4db6ac;
-                    color: white;
-                    padding: 2px 8px;
-                    border-radius: 3px;
-                    font-size: 12px;
-                }}
-                .country-tag {{
-                    background-color: #2196f3;
-                    color: white;
-                    padding: 2px 8px;
-                    border-radius: 3px;
-                    font-size: 12px;
-                }}
-                .week-summary {{
-                    background-color: #f8f9fa;
-                    padding: 10px;
-                    margin: 10px 0;
-                    border-radius: 5px;
-                }}
-                .footer {{
-                    margin-top: 30px;
-                    padding: 20px;
-                    background-color: #f8f9fa;
-                    text-align: center;
-                    font-size: 12px;
-                    color: #666;
-                }}
-                .info-box {{
-                    background-color: #fff3cd;
-                    border: 1px solid #ffeeba;
-                    border-radius: 5px;
-                    padding: 15px;
-                    margin: 20px 0;
-                }}
-            </style>
-        </head>
+        # Start HTML — static head first; sections are collected and joined once at the end
+        parts = [_CUSTOMS_HTML_HEAD, f"""
         <body>
             <div class="header">
                 <h1>🛃 Custom Clearance Schedule</h1>
@@ -1195,174 +1709,168 @@ class EmailSender:
                         </div>
                     </div>
                 </div>
-        """
+        """]
         
         # EPE Section (Xuất khẩu tại chỗ)
         if not epe_df.empty:
-            html += """
+            parts.append("""
                 <div class="section-header">📦 XUẤT KHẨU TẠI CHỖ (EPE Companies)</div>
                 <p>Deliveries to Export Processing Enterprises within Vietnam requiring local export procedures:</p>
-            """
+            """)
             
-            # Group EPE by location and week
-            epe_df['week_start'] = epe_df['delivery_date'] - pd.to_timedelta(epe_df['delivery_date'].dt.dayofweek, unit='D')
-            epe_df['week_number'] = epe_df['delivery_date'].dt.isocalendar().week
+            # Rows for every (location, week) from one aggregation (Monday–Sunday periods)
+            epe_rows = epe_df.groupby(
+                ['recipient_state_province', epe_df['delivery_date'].dt.to_period('W-SUN').rename('_week'),
+                 'delivery_date', 'recipient_company', 'customer',
+                 'dn_number', 'product_id', 'pt_code', 'product_pn'],
+                sort=True, observed=True
+            )['remaining_quantity_to_deliver'].sum().reset_index()
+            epe_rows['_date_s'] = epe_rows['delivery_date'].dt.strftime('%b %d')
+            epe_rows['_qty_s'] = epe_rows['remaining_quantity_to_deliver'].map('{:,.0f}'.format)
+            location_totals = epe_df.groupby('recipient_state_province', observed=True, sort=False).agg(
+                deliveries=('delivery_id', 'nunique'),
+                quantity=('remaining_quantity_to_deliver', 'sum'),
+            )
             
-            # Group by location first
-            for location, loc_df in epe_df.groupby('recipient_state_province', sort=True):
-                location_deliveries = loc_df['delivery_id'].nunique()
-                location_quantity = loc_df['remaining_quantity_to_deliver'].sum()
-                
-                html += f"""
+            # Location header when the location changes, then one table per week
+            current_location = None
+            for (location, week), display_df in epe_rows.groupby(['recipient_state_province', '_week'], observed=True, sort=False):
+                if location != current_location:
+                    current_location = location
+                    location_deliveries, location_quantity = location_totals.loc[location]
+                    
+                    parts.append(f"""
                     <div class="sub-section-header">
                         <span class="location-tag">{location}</span>
                         <span style="float: right; font-size: 14px; font-weight: normal;">
-                            {location_deliveries} deliveries | {location_quantity:,.0f} units
+                            {location_deliveries:.0f} deliveries | {location_quantity:,.0f} units
                         </span>
                     </div>
-                """
+                    """)
                 
-                # Then group by week within location
-                for week_key, week_df in loc_df.groupby('week_start', sort=True):
-                    week_number = week_df['week_number'].iloc[0]
-                    week_end = week_key + timedelta(days=6)
-                    
-                    html += f"""
-                        <div class="week-summary">
-                            <strong>Week {week_number} ({week_key.strftime('%b %d')} - {week_end.strftime('%b %d')})</strong>
-                        </div>
-                        <table>
-                            <tr>
-                                <th width="90">Date</th>
-                                <th width="180">EPE Company</th>
-                                <th width="150">Customer</th>
-                                <th width="100">DN Number</th>
-                                <th width="80">PT Code</th>
-                                <th width="120">Product</th>
-                                <th width="80">Quantity</th>
-                            </tr>
+                week_key = week.start_time
+                week_number = week_key.isocalendar()[1]
+                week_end = week_key + timedelta(days=6)
+                
+                parts.append(f"""
+                    <div class="week-summary">
+                        <strong>Week {week_number} ({week_key.strftime('%b %d')} - {week_end.strftime('%b %d')})</strong>
+                    </div>
+                    <table>
+                        <tr>
+                            <th width="90">Date</th>
+                            <th width="180">EPE Company</th>
+                            <th width="150">Customer</th>
+                            <th width="100">DN Number</th>
+                            <th width="80">PT Code</th>
+                            <th width="120">Product</th>
+                            <th width="80">Quantity</th>
+                        </tr>
+                """)
+                
+                parts.extend(
+                    f"""
+                        <tr class="epe-row">
+                            <td>{date_s}</td>
+                            <td>{first}</td>
+                            <td>{second}</td>
+                            <td>{dn}</td>
+                            <td>{pt}</td>
+                            <td>{product}</td>
+                            <td>{qty_s}</td>
+                        </tr>
                     """
-                    
-                    # Group by delivery for display
-                    display_df = week_df.groupby(['delivery_date', 'recipient_company', 'customer', 
-                                                'dn_number', 'product_id', 'pt_code', 'product_pn']).agg({
-                        'remaining_quantity_to_deliver': 'sum'
-                    }).reset_index()
-                    
-                    for _, row in display_df.iterrows():
-                        html += f"""
-                            <tr class="epe-row">
-                                <td>{row['delivery_date'].strftime('%b %d')}</td>
-                                <td>{row['recipient_company']}</td>
-                                <td>{row['customer']}</td>
-                                <td>{row['dn_number']}</td>
-                                <td>{row['pt_code']}</td>
-                                <td>{row['product_pn']}</td>
-                                <td>{row['remaining_quantity_to_deliver']:,.0f}</td>
-                            </tr>
-                        """
-                    
-                    html += "</table>"
+                    for date_s, first, second, dn, pt, product, qty_s in zip(
+                        display_df['_date_s'], display_df['recipient_company'], display_df['customer'],
+                        display_df['dn_number'], display_df['pt_code'], display_df['product_pn'],
+                        display_df['_qty_s'],
+                    )
+                )
+                
+                parts.append("</table>")
         
         # Foreign Section (Xuất khẩu thông thường)
         if not foreign_df.empty:
-            html += """
+            parts.append("""
                 <div class="section-header">🌍 XUẤT KHẨU THÔNG THƯỜNG (Foreign Customers)</div>
                 <p>International shipments requiring standard export procedures:</p>
-            """
+            """)
             
-            # Group Foreign by country and week
-            foreign_df['week_start'] = foreign_df['delivery_date'] - pd.to_timedelta(foreign_df['delivery_date'].dt.dayofweek, unit='D')
-            foreign_df['week_number'] = foreign_df['delivery_date'].dt.isocalendar().week
+            # Rows for every (country, week) from one aggregation (Monday–Sunday periods)
+            foreign_rows = foreign_df.groupby(
+                ['customer_country_name', foreign_df['delivery_date'].dt.to_period('W-SUN').rename('_week'),
+                 'delivery_date', 'customer', 'recipient_company',
+                 'dn_number', 'product_id', 'pt_code', 'product_pn'],
+                sort=True, observed=True
+            )['remaining_quantity_to_deliver'].sum().reset_index()
+            foreign_rows['_date_s'] = foreign_rows['delivery_date'].dt.strftime('%b %d')
+            foreign_rows['_qty_s'] = foreign_rows['remaining_quantity_to_deliver'].map('{:,.0f}'.format)
+            country_totals = foreign_df.groupby('customer_country_name', observed=True, sort=False).agg(
+                deliveries=('delivery_id', 'nunique'),
+                quantity=('remaining_quantity_to_deliver', 'sum'),
+            )
             
-            # Group by country first
-            for country, country_df in foreign_df.groupby('customer_country_name', sort=True):
-                country_deliveries = country_df['delivery_id'].nunique()
-                country_quantity = country_df['remaining_quantity_to_deliver'].sum()
-                
-                html += f"""
+            # Country header when the country changes, then one table per week
+            current_country = None
+            for (country, week), display_df in foreign_rows.groupby(['customer_country_name', '_week'], observed=True, sort=False):
+                if country != current_country:
+                    current_country = country
+                    country_deliveries, country_quantity = country_totals.loc[country]
+                    
+                    parts.append(f"""
                     <div class="sub-section-header">
                         <span class="country-tag">{country}</span>
                         <span style="float: right; font-size: 14px; font-weight: normal;">
-                            {country_deliveries} deliveries | {country_quantity:,.0f} units
+                            {country_deliveries:.0f} deliveries | {country_quantity:,.0f} units
                         </span>
                     </div>
-                """
+                    """)
                 
-                # Then group by week within country
-                for week_key, week_df in country_df.groupby('week_start', sort=True):
-                    week_number = week_df['week_number'].iloc[0]
-                    week_end = week_key + timedelta(days=6)
-                    
-                    html += f"""
-                        <div class="week-summary">
-                            <strong>Week {week_number} ({week_key.strftime('%b %d')} - {week_end.strftime('%b %d')})</strong>
-                        </div>
-                        <table>
-                            <tr>
-                                <th width="90">Date</th>
-                                <th width="200">Customer</th>
-                                <th width="180">Ship To</th>
-                                <th width="100">DN Number</th>
-                                <th width="80">PT Code</th>
-                                <th width="120">Product</th>
-                                <th width="80">Quantity</th>
-                            </tr>
+                week_key = week.start_time
+                week_number = week_key.isocalendar()[1]
+                week_end = week_key + timedelta(days=6)
+                
+                parts.append(f"""
+                    <div class="week-summary">
+                        <strong>Week {week_number} ({week_key.strftime('%b %d')} - {week_end.strftime('%b %d')})</strong>
+                    </div>
+                    <table>
+                        <tr>
+                            <th width="90">Date</th>
+                            <th width="200">Customer</th>
+                            <th width="180">Ship To</th>
+                            <th width="100">DN Number</th>
+                            <th width="80">PT Code</th>
+                            <th width="120">Product</th>
+                            <th width="80">Quantity</th>
+                        </tr>
+                """)
+                
+                parts.extend(
+                    f"""
+                        <tr class="foreign-row">
+                            <td>{date_s}</td>
+                            <td>{first}</td>
+                            <td>{second}</td>
+                            <td>{dn}</td>
+                            <td>{pt}</td>
+                            <td>{product}</td>
+                            <td>{qty_s}</td>
+                        </tr>
                     """
-                    
-                    # Group by delivery for display
-                    display_df = week_df.groupby(['delivery_date', 'customer', 'recipient_company',
-                                                'dn_number', 'product_id', 'pt_code', 'product_pn']).agg({
-                        'remaining_quantity_to_deliver': 'sum'
-                    }).reset_index()
-                    
-                    for _, row in display_df.iterrows():
-                        html += f"""
-                            <tr class="foreign-row">
-                                <td>{row['delivery_date'].strftime('%b %d')}</td>
-                                <td>{row['customer']}</td>
-                                <td>{row['recipient_company']}</td>
-                                <td>{row['dn_number']}</td>
-                                <td>{row['pt_code']}</td>
-                                <td>{row['product_pn']}</td>
-                                <td>{row['remaining_quantity_to_deliver']:,.0f}</td>
-                            </tr>
-                        """
-                    
-                    html += "</table>"
-        
-        # Add customs information box
-        html += """
-            <div class="info-box">
-                <h4>📋 Customs Documentation Requirements:</h4>
-                <p><strong>For EPE (Xuất khẩu tại chỗ):</strong></p>
-                <ul>
-                    <li>Tờ khai xuất khẩu tại chỗ</li>
-                    <li>C/O Form D nội địa</li>
-                    <li>Hóa đơn VAT</li>
-                    <li>Phiếu xuất kho</li>
-                </ul>
-                <p><strong>For Foreign Export:</strong></p>
-                <ul>
-                    <li>Export Declaration (Tờ khai xuất khẩu)</li>
-                    <li>Certificate of Origin (based on destination country)</li>
-                    <li>Commercial Invoice</li>
-                    <li>Packing List</li>
-                    <li>Bill of Lading / Airway Bill</li>
-                </ul>
-            </div>
-            
-            <div class="footer">
-                <p>This is an automated customs clearance schedule from Outbound Logistics System</p>
-                <p>For questions, please contact: <a href="mailto:outbound@prostech.vn">outbound@prostech.vn</a></p>
-                <p>Phone: +84 33 476273</p>
-            </div>
-        </div>
-        </body>
-        </html>
-        """
+                    for date_s, first, second, dn, pt, product, qty_s in zip(
+                        display_df['_date_s'], display_df['customer'], display_df['recipient_company'],
+                        display_df['dn_number'], display_df['pt_code'], display_df['product_pn'],
+                        display_df['_qty_s'],
+                    )
+                )
+                
+                parts.append("</table>")
         
-        return html
+        # Customs information box and footer
+        parts.append(_CUSTOMS_HTML_FOOTER)
+        
+        return ''.join(parts)
 
     def create_customs_excel_attachment(self, delivery_df):
         """Create Excel file for customs clearance with separate sheets"""
@@ -1379,7 +1887,7 @@ class EmailSender:
         for col in date_columns:
             if col in excel_df.columns:
                 try:
-                    excel_df[col] = pd.to_datetime(excel_df[col]).dt.strftime('%Y-%m-%d')
+                    excel_df[col] = _as_datetime(excel_df[col]).dt.strftime('%Y-%m-%d')
                 except Exception as e:
                     logger.warning(f"Could not format date column {col}: {e}")
         
@@ -1395,14 +1903,24 @@ class EmailSender:
         
         logger.info(f"EPE records: {len(epe_df)}, Foreign records: {len(foreign_df)}")
         
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+        with pd.ExcelWriter(output, engine='xlsxwriter', engine_kwargs=EXCEL_WRITER_KWARGS) as writer:
             try:
+                # Get workbook; sheets are streamed row by row
+                workbook = writer.book
+                # Same look as the to_excel header
+                to_excel_header = workbook.add_format({
+                    'bold': True,
+                    'border': 1,
+                    'align': 'center',
+                    'valign': 'top'
+                })
+                
                 # Summary sheet
                 summary_data = []
                 
                 # EPE summary by location
                 if not epe_df.empty:
-                    epe_summary = epe_df.groupby('recipient_state_province').agg({
+                    epe_summary = epe_df.groupby('recipient_state_province', observed=True).agg({
                         'delivery_id': 'nunique',
                         'dn_number': 'nunique',
                         'remaining_quantity_to_deliver': 'sum',
@@ -1414,7 +1932,7 @@ class EmailSender:
                 
                 # Foreign summary by country
                 if not foreign_df.empty:
-                    foreign_summary = foreign_df.groupby('customer_country_name').agg({
+                    foreign_summary = foreign_df.groupby('customer_country_name', observed=True).agg({
                         'delivery_id': 'nunique',
                         'dn_number': 'nunique',
                         'remaining_quantity_to_deliver': 'sum',
@@ -1426,7 +1944,7 @@ class EmailSender:
                 
                 if summary_data:
                     summary_df = pd.concat(summary_data, ignore_index=True)
-                    summary_df.to_excel(writer, sheet_name='Summary', index=False)
+                    _write_sheet(workbook, 'Summary', summary_df, to_excel_header)
                 
                 # EPE Details sheet
                 if not epe_df.empty:
@@ -1456,7 +1974,7 @@ class EmailSender:
                         if sort_cols:
                             epe_export = epe_export.sort_values(sort_cols)
                         
-                        epe_export.to_excel(writer, sheet_name='EPE Deliveries', index=False)
+                        _write_sheet(workbook, 'EPE Deliveries', epe_export, to_excel_header)
                         logger.info("EPE Details sheet created successfully")
                     else:
                         logger.warning("No columns available for EPE export")
@@ -1489,7 +2007,7 @@ class EmailSender:
                         if sort_cols:
                             foreign_export = foreign_export.sort_values(sort_cols)
                         
-                        foreign_export.to_excel(writer, sheet_name='Foreign Deliveries', index=False)
+                        _write_sheet(workbook, 'Foreign Deliveries', foreign_export, to_excel_header)
                         logger.info("Foreign Details sheet created successfully")
                     else:
                         logger.warning("No columns available for Foreign export")
@@ -1501,12 +2019,14 @@ class EmailSender:
                     
                     # Check if delivery_date exists and convert
                     if 'delivery_date' in all_df.columns:
-                        all_df['delivery_date'] = pd.to_datetime(all_df['delivery_date'])
-                        all_df['week_start'] = all_df['delivery_date'] - pd.to_timedelta(all_df['delivery_date'].dt.dayofweek, unit='D')
+                        all_df['delivery_date'] = _as_datetime(all_df['delivery_date'])
+                        dates = all_df['delivery_date'].to_numpy().astype('datetime64[D]')
+                        dow = all_df['delivery_date'].dt.dayofweek.to_numpy().astype('timedelta64[D]')
+                        all_df['week_start'] = (dates - dow).astype('datetime64[ns]')
                         all_df['week_number'] = all_df['delivery_date'].dt.isocalendar().week
                         
                         # Group by week and type
-                        weekly_summary = all_df.groupby(['week_start', 'week_number', 'customs_type']).agg({
+                        weekly_summary = all_df.groupby(['week_start', 'week_number', 'customs_type'], observed=True).agg({
                             'delivery_id': 'nunique',
                             'remaining_quantity_to_deliver': 'sum'
                         }).reset_index()
@@ -1520,15 +2040,12 @@ class EmailSender:
                         
                         weekly_summary = weekly_summary[['Week Number', 'Week Start', 'Week End', 'Type', 'Deliveries', 'Quantity']]
                         
-                        weekly_summary.to_excel(writer, sheet_name='Weekly Timeline', index=False)
+                        _write_sheet(workbook, 'Weekly Timeline', weekly_summary, to_excel_header)
                     else:
                         logger.warning("delivery_date column not found for timeline sheet")
                 except Exception as e:
                     logger.warning(f"Could not create timeline sheet: {e}")
                 
-                # Get workbook for formatting
-                workbook = writer.book
-                
                 # Define formats
                 header_format = workbook.add_format({
                     'bold': True,
@@ -1545,8 +2062,7 @@ class EmailSender:
                 })
                 
                 # Apply formatting to all sheets
-                for sheet_name in writer.sheets:
-                    worksheet = writer.sheets[sheet_name]
+                for worksheet in workbook.worksheets():
                     worksheet.set_column(0, 20, 15)  # Default width
                     worksheet.freeze_panes(1, 0)  # Freeze header row
                     
@@ -1577,8 +2093,8 @@ class EmailSender:
             msg = MIMEMultipart('mixed')
             
             # Count deliveries
-            epe_count = delivery_df[delivery_df['customs_type'] == 'EPE']['delivery_id'].nunique()
-            foreign_count = delivery_df[delivery_df['customs_type'] == 'Foreign']['delivery_id'].nunique()
+            epe_count = _count_ids(delivery_df.loc[delivery_df['customs_type'] == 'EPE', 'delivery_id'])
+            foreign_count = _count_ids(delivery_df.loc[delivery_df['customs_type'] == 'Foreign', 'delivery_id'])
             
             week_text = f"{weeks_ahead} Week" if weeks_ahead == 1 else f"{weeks_ahead} Weeks"
             msg['Subject'] = f"🛃 Custom Clearance Schedule ({week_text}) - {epe_count} EPE & {foreign_count} Foreign Deliveries"
@@ -1598,9 +2114,7 @@ class EmailSender:
             excel_attached = False
             try:
                 excel_data = self.create_customs_excel_attachment(delivery_df)
-                excel_part = MIMEBase('application', 'vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-                excel_part.set_payload(excel_data.read())
-                encoders.encode_base64(excel_part)
+                excel_part = _xlsx_part(excel_data)
                 
                 filename = f"customs_clearance_schedule_{datetime.now().strftime('%Y%m%d')}.xlsx"
                 excel_part.add_header(
@@ -1631,13 +2145,10 @@ class EmailSender:
             
             # Create ICS calendar attachment
             try:
-                calendar_gen = CalendarEventGenerator()
-                ics_content = calendar_gen.create_customs_ics_content(delivery_df, self.sender_email)
+                ics_content = self.calendar_gen.create_customs_ics_content(delivery_df, self.sender_email)
                 
                 if ics_content:
-                    ics_part = MIMEBase('text', 'calendar')
-                    ics_part.set_payload(ics_content.encode('utf-8'))
-                    encoders.encode_base64(ics_part)
+                    ics_part = _ics_part(ics_content)
                     ics_filename = f"customs_clearance_{datetime.now().strftime('%Y%m%d')}.ics"
                     ics_part.add_header(
                         'Content-Disposition', 'attachment',
@@ -1650,15 +2161,11 @@ class EmailSender:
             
             # Send email
             logger.info(f"Attempting to send customs clearance email to {recipient_email}...")
-            with smtplib.SMTP(self.smtp_host, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.sender_email, self.sender_password)
-                
-                recipients = [recipient_email]
-                if cc_emails:
-                    recipients.extend(cc_emails)
-                
-                server.sendmail(self.sender_email, recipients, msg.as_string())
+            recipients = [recipient_email]
+            if cc_emails:
+                recipients.extend(cc_emails)
+            
+            self._deliver(msg, recipients)
             
             # Add note about attachment if failed
             attachment_note = ""
@@ -1755,10 +2262,7 @@ class EmailSender:
             if cc_emails:
                 recipients.extend(cc_emails)
 
-            with smtplib.SMTP(self.smtp_host, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.sender_email, self.sender_password)
-                server.sendmail(self.sender_email, recipients, msg.as_string())
+            self._deliver(msg, recipients)
 
             logger.info(
                 f"ETD update email sent to {to_email} "
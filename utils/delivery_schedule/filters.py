@@ -124,9 +124,11 @@ def create_filter_section(filter_options):
                 "ship_to",
             )
         with r3c2:
+            product_labels = filter_options.get('product_labels', {})
             selected_products, exclude_products = _multiselect_excl(
                 "Product", filter_options.get('products', []),
                 "products",
+                format_func=lambda code: product_labels.get(code, code),
             )
         with r3c3:
             selected_brands, exclude_brands = _multiselect_excl(
@@ -348,6 +350,10 @@ def _import_preset():
             elif dtype == 'list' and not isinstance(val, list):
                 val = [val]
 
+            # Older presets stored products as "PT001 - Name" labels
+            if key == 'filter_products':
+                val = [str(v).split(' - ')[0] for v in val]
+
             staged[key] = val
 
         # Stage for next rerun — applied by _apply_pending_import()
@@ -408,7 +414,8 @@ def _resolve_date_preset(preset, date_from, date_to, today, data_min, data_max):
         return data_min, data_max
 
 
-def _multiselect_excl(label, options, key_prefix, default=None, excl_default=False):
+def _multiselect_excl(label, options, key_prefix, default=None, excl_default=False,
+                      format_func=str):
     """Multiselect (full label) + icon-only exclude checkbox beside it.
 
     Layout:  [ ──── multiselect with label ──── ] [☑]
@@ -417,7 +424,7 @@ def _multiselect_excl(label, options, key_prefix, default=None, excl_default=Fal
     mc, xc = st.columns([6, 1])
     with mc:
         selected = st.multiselect(
-            label, options=options, default=default,
+            label, options=options, default=default, format_func=format_func,
             placeholder=f"All {label.lower()}", key=f"filter_{key_prefix}",
         )
     with xc:
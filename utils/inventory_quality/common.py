@@ -250,9 +250,10 @@ def create_excel_download(df: pd.DataFrame, filename: str = "export.xlsx") -> by
         
         # Auto-adjust column widths
         worksheet = writer.sheets['Data']
+        # Lengths via the vectorized string dtype — no Python len() per cell
         for idx, col in enumerate(df.columns):
             max_length = max(
-                df[col].astype(str).map(len).max() if len(df) > 0 else 0,
+                int(df[col].astype('string').str.len().fillna(0).max()) if len(df) > 0 else 0,
                 len(str(col))
             ) + 2
             col_letter = get_column_letter(idx + 1)